@@ -1,85 +1,548 @@
 import os
+import re
+import time
+from typing import Iterator, Optional
 import streamlit as st
 import pandas as pd
 import openai
 from dotenv import load_dotenv
-from crm_logic import CRMAgent
+from crm_logic import CRMAgent, DataStore
+from response_cache import ResponseCache
+from conversation_history import HistoryCompactor, extractive_summary
+from crm_tools import TOOLS, run_tool
+from openai_client import call_with_retries, create_client
+from model_router import ModelMetrics, ModelRouter
+from turn_metrics import SPANS, TurnRecorder, TurnTrace
 
 # Load environment variables
 load_dotenv()
 
+# Every word of a question answered from the local aggregates must be one of
+# these (or a status value or number). Anything else, e.g. a customer name or
+# "for", "in", "last", "since", narrows the question and goes to the model.
+LOCAL_ANSWER_WORDS = frozenset("""
+    a all an any are across amount amounts average best biggest breakdown by can clients client count crm
+    customer customers database do does duplicate duplicated duplicates distribution give highest how
+    i is it largest list many me mean median much my number of our overall paying per percentile please
+    revenue s show split status sum tell the there top total value we what whats what's which who
+""".split())
+
 class AIAssistant:
-    def __init__(self, api_key: str):
-        openai.api_key = api_key
+    def __init__(self, api_key: str, response_cache: Optional[ResponseCache] = None,
+                 client: Optional[openai.OpenAI] = None, max_retries: int = 3,
+                 router: Optional[ModelRouter] = None, metrics: Optional[ModelMetrics] = None,
+                 turn_recorder: Optional[TurnRecorder] = None):
+        # Long-lived client so connections are reused between messages
+        self.client = client if client is not None else create_client(api_key)
+        self.max_retries = max_retries
+        self.response_cache = response_cache
+        # The model and max_tokens are chosen per message by the router
+        self.router = router if router is not None else ModelRouter()
+        self.metrics = metrics if metrics is not None else ModelMetrics()
+        self.turn_recorder = turn_recorder if turn_recorder is not None else TurnRecorder()
+        self.completion_params = {"temperature": 0.7}
+        # Summaries are short and simple, so they use the router's fast model
+        self.summary_params = {"max_tokens": 200, "temperature": 0}
+        self.max_tool_rounds = 3
+    
+    def _create_completion(self, trace: Optional[TurnTrace] = None, **params):
+        """
+        Call the chat completions endpoint, retrying on rate limits and server
+        errors, and record the latency and token usage of the call
+        """
+        started = time.perf_counter()
+        if params.get("stream"):
+            params["stream_options"] = {"include_usage": True}
+        response = call_with_retries(self.client.chat.completions.create, max_retries=self.max_retries, **params)
+        if params.get("stream"):
+            return self._measure_stream(response, params["model"], time.perf_counter() - started, trace)
+        
+        usage = response.usage
+        self._record_call(trace, params["model"], time.perf_counter() - started, usage)
+        return response
+    
+    def _record_call(self, trace: Optional[TurnTrace], model: str, latency: float, usage,
+                     first_token_latency: Optional[float] = None) -> None:
+        """
+        Add a finished call to the per-model metrics and the current turn
+        """
+        prompt_tokens = usage.prompt_tokens if usage else 0
+        completion_tokens = usage.completion_tokens if usage else 0
+        self.metrics.record(model, latency, prompt_tokens, completion_tokens, first_token_latency)
+        if trace is not None:
+            trace.add_time("api", latency)
+            trace.add_call(model, latency, prompt_tokens, completion_tokens, first_token_latency)
+    
+    def _measure_stream(self, stream, model: str, waited: float, trace: Optional[TurnTrace]):
+        """
+        Pass a completion stream through, recording its metrics once it is
+        consumed. Only the time spent waiting for chunks counts as latency,
+        not the time the caller spends rendering them.
+        """
+        first_token = None
+        usage = None
+        chunks = iter(stream)
+        while True:
+            started = time.perf_counter()
+            chunk = next(chunks, None)
+            waited += time.perf_counter() - started
+            if chunk is None:
+                break
+            if first_token is None and chunk.choices:
+                first_token = waited
+            # With include_usage the last chunk carries the usage and no choices
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            yield chunk
+        self._record_call(trace, model, waited, usage, first_token_latency=first_token)
     
-    def chat_with_martina(self, message: str, data: pd.DataFrame, conversation_history: list) -> str:
+    def _summarize_turns(self, previous_summary: str, turns: list, trace: Optional[TurnTrace] = None) -> str:
+        """
+        Fold older turns into the rolling conversation summary, falling back
+        to an extractive summary if the model call fails
+        """
+        transcript = "\n".join(f"User: {turn['user']}\nMartina: {turn['martina']}" for turn in turns)
         try:
-            conversation = [
-                {"role": "system", "content": "You are Martina, a friendly and conversational CRM assistant. "
-                 "Your goal is to help users manage their CRM data effectively. "
-                 "You can assist with analyzing records and providing insights. "
-                 "When users ask you to make changes, inform them to use the menu on the left."}
-            ]
+            response = self._create_completion(
+                trace,
+                messages=[
+                    {"role": "system", "content": "Summarize this CRM assistant conversation in a few short sentences. "
+                     "Keep customer names, IDs, numbers and open questions."},
+                    {"role": "user", "content": f"Summary so far:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}"}
+                ],
+                model=self.router.fast_model,
+                **self.summary_params
+            )
+            return response.choices[0].message.content.strip()
+        except openai.OpenAIError:
+            return extractive_summary(previous_summary, turns)
+    
+    def _build_conversation(self, message: str, data: pd.DataFrame, conversation_history: list,
+                            history_compactor: Optional[HistoryCompactor] = None,
+                            trace: Optional[TurnTrace] = None) -> list:
+        """
+        Build the message list sent to OpenAI for a new user message
+        """
+        conversation = [
+            {"role": "system", "content": "You are Martina, a friendly and conversational CRM assistant. "
+             "Your goal is to help users manage their CRM data effectively. "
+             "You can assist with analyzing records and providing insights. "
+             "Use the provided tools to look up customers instead of guessing. "
+             "When users ask you to make changes, inform them to use the menu on the left."}
+        ]
+        
+        # Recent turns verbatim, older ones as a rolling summary within the token budget
+        if history_compactor is None:
+            conversation.extend(HistoryCompactor().messages(conversation_history))
+        else:
+            # Summary calls belong to the current turn's trace
+            conversation.extend(history_compactor.messages(
+                conversation_history, lambda summary, turns: self._summarize_turns(summary, turns, trace)))
+        
+        conversation.append({"role": "user", "content": message})
+        
+        # Schema and aggregates, cached per data version
+        crm_context = CRMAgent.context_summary(data)
+        conversation.insert(1, {"role": "system", "content": crm_context})
+        return conversation
+    
+    def _answer_locally(self, message: str, data: pd.DataFrame) -> Optional[str]:
+        """
+        Answer simple analytic questions (counts, Amount statistics, top
+        customers, duplicates) from the precomputed aggregates without an
+        OpenAI round trip. Returns None for anything else.
+        """
+        text = message.lower().strip()
+        if data.empty or len(text) > 120:
+            return None
+        
+        stats = CRMAgent.analytics(data)
+        
+        # Only answer when the whole message is one of the known questions
+        status_words = {word for value in stats["status_counts"] for word in (str(value).lower(), f"{str(value).lower()}s")}
+        text = re.sub(r"\bin (the|our|my) (crm|database)\b", "", text)
+        for word in re.findall(r"[a-z0-9']+", text.replace("-", " ")):
+            if word not in LOCAL_ANSWER_WORDS and word not in status_words \
+                    and not re.fullmatch(r"\d+(st|nd|rd|th)?", word):
+                return None
+        statuses = [value for value in stats["status_counts"]
+                    if re.search(rf"\b{re.escape(str(value).lower())}s?\b", text)]
+        if len(statuses) > 1:
+            return None
+        status = statuses[0] if statuses else None
+        about_amount = re.search(r"\b(amount|amounts|revenue|value)\b", text) is not None
+        per_status = re.search(r"\b(by|per) status\b", text) is not None
+        
+        # The answers below that ignore Status would be wrong for a filtered question
+        if status and not re.search(r"\b(average|mean|total|sum|how many|number of|count)\b", text):
+            return None
+        
+        if re.search(r"\bduplicat", text):
+            lines = []
+            for label, info in stats["duplicates"].items():
+                if info["groups"]:
+                    examples = "; ".join(f"{value} (IDs {', '.join(map(str, ids))})"
+                                         for value, ids in list(info["examples"].items())[:5])
+                    lines.append(f"- {label}: {info['groups']} duplicated values across {info['customers']} customers, e.g. {examples}")
+            if not lines:
+                return "I found no customers sharing an email address or a full name."
+            return "Possible duplicates:\n" + "\n".join(lines)
+        
+        top_match = re.search(r"\btop\s*(\d+)?\s*(customers?|clients?)\b", text) or \
+            re.search(r"\b(biggest|largest|best|highest[- ]paying)\s+(customers?|clients?)\b", text)
+        if top_match:
+            count = int(top_match.group(1)) if top_match.group(1) and top_match.group(1).isdigit() else 5
+            top = CRMAgent.top_customers(data, min(count, 50))
+            rows = [f"{i}. {row['Name']} (ID {row['Customer ID']}, {row['Status']}): {row['Amount']:,.2f}"
+                    for i, row in enumerate(top.to_dict('records'), start=1)]
+            return f"Top {len(rows)} customers by amount:\n" + "\n".join(rows)
+        
+        percentile_match = re.search(r"\b(\d{1,2})(?:st|nd|rd|th)?\s*percentile\b", text)
+        if percentile_match or re.search(r"\bmedian\b", text):
+            percent = int(percentile_match.group(1)) if percentile_match else 50
+            value = stats["amount"]["percentiles"].get(percent)
+            if value is None:
+                value = float(data['Amount'].quantile(percent / 100))
+            label = "median" if percent == 50 else f"{percent}th percentile"
+            return f"The {label} amount across all customers is {value:,.2f}."
+        
+        if per_status and re.search(r"\b(average|mean|total|sum)\b", text) and about_amount and not status:
+            lines = [f"- {value}: total {info['total']:,.2f}, average {info['mean']:,.2f} "
+                     f"({info['amount_count']} of {info['count']} customers have an amount)"
+                     if info["amount_count"] else f"- {value}: none of {info['count']} customers have an amount"
+                     for value, info in stats["amount_by_status"].items()]
+            return "Amount by status:\n" + "\n".join(lines)
+        
+        if per_status:
+            if status:
+                return None
+            lines = [f"- {value}: {count}" for value, count in stats["status_counts"].items()]
+            return f"Customers by status ({stats['total_customers']} in total):\n" + "\n".join(lines)
+        
+        if re.search(r"\b(average|mean)\b", text) and (about_amount or status):
+            if status:
+                mean = stats["amount_by_status"].get(status, {}).get("mean", 0.0)
+                return f"The average amount of {status} customers is {mean:,.2f}."
+            return f"The average amount across all customers is {stats['amount']['mean']:,.2f}."
+        
+        if re.search(r"\b(total|sum)\b", text) and about_amount:
+            if status:
+                total = stats["amount_by_status"].get(status, {}).get("total", 0.0)
+                return f"The total amount of {status} customers is {total:,.2f}."
+            return f"The total amount across all customers is {stats['amount']['total']:,.2f}."
+        
+        if re.search(r"\b(breakdown|distribution|split)\b.*\bstatus\b|\bstatus (breakdown|distribution|split)\b", text):
+            lines = [f"- {value}: {count}" for value, count in stats["status_counts"].items()]
+            return f"Customers by status ({stats['total_customers']} in total):\n" + "\n".join(lines)
+        
+        if re.search(r"\b(how many|number of|count)\b", text) and (re.search(r"\b(customers?|clients?)\b", text) or status):
+            if status:
+                return f"There are {stats['status_counts'][status]} {status} customers."
+            return f"There are {stats['total_customers']} customers in the CRM."
+        
+        return None
+    
+    def _cache_key(self, conversation: list, data: pd.DataFrame, params: dict) -> Optional[str]:
+        """
+        Return the response cache key for a conversation, or None without a cache
+        """
+        if self.response_cache is None:
+            return None
+        return ResponseCache.make_key(conversation, CRMAgent.data_version(data), **params)
+    
+    def _cached_response(self, cache_key: Optional[str]) -> Optional[str]:
+        """
+        Look up a previous reply to exactly the same prompt and data
+        """
+        if cache_key is None:
+            return None
+        return self.response_cache.get(cache_key)
+    
+    def _store_response(self, cache_key: Optional[str], reply: str) -> None:
+        """
+        Remember a reply for identical future prompts on the same data
+        """
+        if cache_key is not None and reply:
+            self.response_cache.put(cache_key, reply)
+    
+    def _tool_params(self, tool_round: int) -> dict:
+        """
+        Offer the CRM tools, forcing a plain answer in the last round
+        """
+        if tool_round < self.max_tool_rounds:
+            return {"tools": TOOLS}
+        return {"tools": TOOLS, "tool_choice": "none"}
+    
+    def _add_tool_results(self, messages: list, content: Optional[str], tool_calls: list, data: pd.DataFrame,
+                          trace: TurnTrace) -> None:
+        """
+        Append the model's tool calls and their local results to the conversation
+        """
+        messages.append({"role": "assistant", "content": content, "tool_calls": tool_calls})
+        with trace.span("tools"):
+            for call in tool_calls:
+                messages.append({
+                    "role": "tool",
+                    "tool_call_id": call["id"],
+                    "content": run_tool(call["function"]["name"], call["function"]["arguments"], data)
+                })
+    
+    def _complete(self, conversation: list, data: pd.DataFrame, params: dict, trace: TurnTrace) -> str:
+        """
+        Request a reply, running the CRM lookups the model asks for in between
+        """
+        messages = list(conversation)
+        for tool_round in range(self.max_tool_rounds + 1):
+            response = self._create_completion(
+                trace,
+                messages=messages,
+                **self._tool_params(tool_round),
+                **params
+            )
             
-            conversation.extend([
-                {"role": "user", "content": msg["user"]} if i % 2 == 0 else 
-                {"role": "assistant", "content": msg["martina"]}
-                for i, msg in enumerate(conversation_history)
-            ])
+            reply = response.choices[0].message
+            if not reply.tool_calls:
+                return (reply.content or "").strip()
+            tool_calls = [{"id": call.id, "type": "function",
+                           "function": {"name": call.function.name, "arguments": call.function.arguments}}
+                          for call in reply.tool_calls]
+            self._add_tool_results(messages, reply.content, tool_calls, data, trace)
+        return ""
+    
+    def _stream_completion(self, conversation: list, data: pd.DataFrame, params: dict, trace: TurnTrace) -> Iterator[str]:
+        """
+        Stream a reply, running the CRM lookups the model asks for in between
+        """
+        messages = list(conversation)
+        for tool_round in range(self.max_tool_rounds + 1):
+            stream = self._create_completion(
+                trace,
+                messages=messages,
+                stream=True,
+                **self._tool_params(tool_round),
+                **params
+            )
             
-            conversation.append({"role": "user", "content": message})
+            # Tool calls arrive in fragments, keyed by their position
+            content = []
+            tool_calls = {}
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content.append(delta.content)
+                    yield delta.content
+                for call in delta.tool_calls or []:
+                    entry = tool_calls.setdefault(call.index, {"id": "", "type": "function",
+                                                               "function": {"name": "", "arguments": ""}})
+                    if call.id:
+                        entry["id"] = call.id
+                    if call.function and call.function.name:
+                        entry["function"]["name"] += call.function.name
+                    if call.function and call.function.arguments:
+                        entry["function"]["arguments"] += call.function.arguments
             
-            crm_context = f"""
-            Current CRM Data Overview:
-            - Total Customers: {len(data)}
-            - Columns: {', '.join(data.columns)}
+            if not tool_calls:
+                return
+            self._add_tool_results(messages, "".join(content) or None,
+                                   [tool_calls[index] for index in sorted(tool_calls)], data, trace)
+    
+    def chat_with_martina(self, message: str, data: pd.DataFrame, conversation_history: list,
+                          history_compactor: Optional[HistoryCompactor] = None,
+                          trace: Optional[TurnTrace] = None) -> str:
+        trace = trace if trace is not None else TurnTrace()
+        try:
+            with trace.span("local"):
+                local_reply = self._answer_locally(message, data)
+            if local_reply is not None:
+                trace.source = "local"
+                return local_reply
             
-            Sample Data:
-            {data.head().to_string(index=False)}
-            """
-            conversation.insert(1, {"role": "system", "content": crm_context})
+            with trace.span("context"):
+                conversation = self._build_conversation(message, data, conversation_history, history_compactor, trace)
+                params = {**self.completion_params, **self.router.route(message, conversation_history)}
             
-            response = openai.chat.completions.create(
-                model="gpt-4",
-                messages=conversation,
-                max_tokens=300,
-                temperature=0.7
-            )
+            with trace.span("cache"):
+                cache_key = self._cache_key(conversation, data, params)
+                cached_reply = self._cached_response(cache_key)
+            if cached_reply is not None:
+                trace.source = "cache"
+                return cached_reply
             
-            return response.choices[0].message.content.strip()
+            reply = self._complete(conversation, data, params, trace)
+            self._store_response(cache_key, reply)
+            return reply
             
         except openai.OpenAIError as e:
+            trace.source = "error"
             error_message = f"OpenAI API Error: {str(e)}"
             st.error(error_message)
             return error_message
         except Exception as e:
+            trace.source = "error"
             error_message = f"Unexpected error: {str(e)}"
             st.error(error_message)
             return error_message
+    
+    def stream_chat_with_martina(self, message: str, data: pd.DataFrame, conversation_history: list,
+                                 history_compactor: Optional[HistoryCompactor] = None,
+                                 trace: Optional[TurnTrace] = None) -> Iterator[str]:
+        """
+        Same as chat_with_martina, but yields the reply in chunks as they arrive
+        """
+        trace = trace if trace is not None else TurnTrace()
+        try:
+            with trace.span("local"):
+                local_reply = self._answer_locally(message, data)
+            if local_reply is not None:
+                trace.source = "local"
+                yield local_reply
+                return
+            
+            with trace.span("context"):
+                conversation = self._build_conversation(message, data, conversation_history, history_compactor, trace)
+                params = {**self.completion_params, **self.router.route(message, conversation_history)}
+            
+            with trace.span("cache"):
+                cache_key = self._cache_key(conversation, data, params)
+                cached_reply = self._cached_response(cache_key)
+            if cached_reply is not None:
+                trace.source = "cache"
+                yield cached_reply
+                return
+            
+            chunks = []
+            for text in self._stream_completion(conversation, data, params, trace):
+                chunks.append(text)
+                yield text
+            
+            self._store_response(cache_key, "".join(chunks).strip())
+            
+        except openai.OpenAIError as e:
+            trace.source = "error"
+            error_message = f"OpenAI API Error: {str(e)}"
+            st.error(error_message)
+            yield error_message
+        except Exception as e:
+            trace.source = "error"
+            error_message = f"Unexpected error: {str(e)}"
+            st.error(error_message)
+            yield error_message
+
+@st.cache_resource
+def get_openai_client(api_key: str) -> openai.OpenAI:
+    """
+    Create the OpenAI client once per server process and API key
+    """
+    return create_client(
+        api_key,
+        connect_timeout=float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5")),
+        read_timeout=float(os.getenv("OPENAI_READ_TIMEOUT", "60"))
+    )
+
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    """
+    Open the reply cache once per server process
+    """
+    return ResponseCache(os.getenv("MARTINA_CACHE_PATH", ".martina_cache.sqlite"))
+
+@st.cache_resource
+def get_assistant() -> AIAssistant:
+    """
+    Create Martina once per server process. All sessions and reruns share
+    the assistant, its OpenAI client and its reply cache; per-session state
+    (history, summaries) stays in st.session_state.
+    """
+    api_key = st.secrets.OPENAI_API_KEY
+    if not api_key:
+        raise ValueError("OpenAI API Key not found in secrets")
+    return AIAssistant(
+        api_key,
+        response_cache=get_response_cache(),
+        client=get_openai_client(api_key),
+        max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "3")),
+        router=ModelRouter(
+            strong_model=os.getenv("MARTINA_MODEL", "gpt-4"),
+            fast_model=os.getenv("MARTINA_FAST_MODEL", "gpt-4o-mini"),
+            max_simple_chars=int(os.getenv("MARTINA_SIMPLE_MAX_CHARS", "160")),
+            enabled=os.getenv("MARTINA_ROUTING", "on").lower() not in ("0", "off", "false")
+        ),
+        turn_recorder=TurnRecorder(
+            jsonl_path=os.getenv("MARTINA_METRICS_JSONL"),
+            prometheus_path=os.getenv("MARTINA_METRICS_PROMETHEUS")
+        )
+    )
+
+def render_debug_panel(assistant: AIAssistant) -> None:
+    """
+    Show per-turn timings, model usage and cache statistics in the sidebar
+    """
+    with st.sidebar.expander("🛠️ Debug"):
+        turns = assistant.turn_recorder.recent()
+        if turns:
+            st.caption("Recent turns (ms)")
+            st.dataframe(pd.DataFrame([
+                {
+                    "source": turn["source"],
+                    **{name: round(turn["spans"].get(name, 0.0) * 1000, 1) for name in SPANS + ("total",)},
+                    "prompt tokens": turn["prompt_tokens"],
+                    "completion tokens": turn["completion_tokens"],
+                }
+                for turn in turns
+            ]), hide_index=True)
+        else:
+            st.caption("No chat turns yet.")
+        
+        st.caption("Models")
+        st.json(assistant.metrics.summary(), expanded=False)
+        st.caption("Caches")
+        st.json({
+            "replies": assistant.response_cache.stats() if assistant.response_cache else None,
+            "data": CRMAgent.cache_info(),
+        }, expanded=False)
+        st.caption("Prometheus")
+        st.code(assistant.turn_recorder.prometheus(), language="text")
 
 def main():
     st.set_page_config(page_title="CRM Chatbot Martina", page_icon=":robot_face:", layout="wide")
     
     if "conversation_history" not in st.session_state:
         st.session_state["conversation_history"] = []
+    if "history_compactor" not in st.session_state:
+        st.session_state["history_compactor"] = HistoryCompactor(
+            keep_turns=int(os.getenv("MARTINA_HISTORY_TURNS", "6")),
+            token_budget=int(os.getenv("MARTINA_HISTORY_TOKEN_BUDGET", "1500"))
+        )
     
-    file_path = "data.csv"
+    # Data file from configuration; the extension selects the storage backend
+    file_path = os.getenv("CRM_DATA_PATH", "data.csv")
     
     st.title("🤖 CRM Chatbot Martina")
     st.markdown("Your AI-powered Customer Relationship Management Assistant")
     
+    # All sessions share one copy of the data per version; each session keeps
+    # the version it was shown until it refreshes or writes
+    store = DataStore.get(file_path)
+    latest = None
     try:
-        data = CRMAgent.load_data(file_path)
+        latest = store.snapshot()
     except Exception as e:
         st.error(f"Error loading data: {e}")
+    snapshot = st.session_state.get("data_snapshot")
+    if snapshot is None or snapshot.file_path != file_path:
+        snapshot = st.session_state["data_snapshot"] = latest
+    if snapshot is not None:
+        data = snapshot.editable()
+    else:
         data = pd.DataFrame(columns=["Customer ID", "First Name", "Last Name", "Email", "Phone", "Status", "Amount"])
     
     try:
-        api_key = st.secrets.OPENAI_API_KEY
-        if not api_key:
-            st.error("OpenAI API Key not found in secrets")
-            return
-        assistant = AIAssistant(api_key)
+        assistant = get_assistant()
+    except ValueError as e:
+        st.error(str(e))
+        return
     except Exception as e:
         st.error("Error initializing AI Assistant. Please check your API key configuration.")
         return
@@ -94,6 +557,12 @@ def main():
             "Delete Customer",
             "Search Customers"
         ])
+        
+        if snapshot is not None and latest is not None and latest.version > snapshot.version:
+            st.info("The customer data has changed since it was loaded.")
+            if st.button("Refresh data"):
+                st.session_state["data_snapshot"] = latest
+                st.rerun()
     
     if action == "Chat with Martina":
         st.subheader("💬 Chat with Martina")
@@ -105,22 +574,27 @@ def main():
         
         if user_input := st.chat_input("Type your message"):
             try:
-                bot_response = assistant.chat_with_martina(
-                    user_input, 
-                    data, 
-                    st.session_state["conversation_history"]
+                st.chat_message("user").write(user_input)
+                
+                # Render the reply token by token while it is generated
+                trace = TurnTrace()
+                started = time.perf_counter()
+                bot_response = st.chat_message("assistant").write_stream(
+                    assistant.stream_chat_with_martina(
+                        user_input, 
+                        data, 
+                        st.session_state["conversation_history"],
+                        st.session_state["history_compactor"],
+                        trace
+                    )
                 )
+                assistant.turn_recorder.record(trace, time.perf_counter() - started)
                 
                 st.session_state["conversation_history"].append({
                     "user": user_input,
-                    "martina": bot_response
+                    "martina": bot_response.strip()
                 })
                 
-                st.chat_message("user").write(user_input)
-                st.chat_message("assistant").write(bot_response)
-                
-                data = CRMAgent.load_data(file_path)
-                
             except Exception as e:
                 st.error(f"An unexpected error occurred: {e}")
     
@@ -154,9 +628,13 @@ def main():
                 }
                 
                 try:
-                    result = CRMAgent.add_customer(data, customer_details, file_path)
-                    st.success(result)
-                    data = CRMAgent.load_data(file_path)
+                    result, updated_data = CRMAgent.add_customer(data, customer_details, file_path)
+                    if updated_data is None:
+                        st.error(result)
+                    else:
+                        st.success(result)
+                        st.session_state["data_snapshot"] = store.publish(updated_data)
+                        data = st.session_state["data_snapshot"].editable()
                 except Exception as e:
                     st.error(f"Error adding customer: {e}")
     
@@ -166,16 +644,13 @@ def main():
             # Search functionality
             search_query = st.text_input("🔍 Search customers")
             
+            # Filter data based on search
+            display_data = CRMAgent.search_records(data, search_query)
+            
             # Create display DataFrame
-            display_data = data.copy()
+            display_data = display_data.copy()
             display_data['Select'] = False
             
-            # Filter data based on search
-            if search_query:
-                filtered_mask = display_data.astype(str).apply(
-                    lambda x: x.str.contains(search_query, case=False, na=False)).any(axis=1)
-                display_data = display_data[filtered_mask]
-            
             # Create a streamlit data editor for selection
             edited_df = st.data_editor(
                 display_data,
@@ -231,15 +706,19 @@ def main():
                         }
                         
                         try:
-                            result = CRMAgent.update_customer(
+                            result, updated_data = CRMAgent.update_customer(
                                 data, 
                                 current_customer["Customer ID"], 
                                 updates, 
                                 file_path
                             )
-                            st.success(result)
-                            data = CRMAgent.load_data(file_path)
-                            st.rerun()
+                            # Keep the error visible instead of rerunning past it
+                            if updated_data is None:
+                                st.error(result)
+                            else:
+                                st.success(result)
+                                st.session_state["data_snapshot"] = store.publish(updated_data)
+                                st.rerun()
                         except Exception as e:
                             st.error(f"Error updating customer: {e}")
         else:
@@ -251,16 +730,13 @@ def main():
             # Search functionality
             search_query = st.text_input("🔍 Search customers to delete")
             
+            # Filter data based on search
+            display_data = CRMAgent.search_records(data, search_query)
+            
             # Create display DataFrame
-            display_data = data.copy()
+            display_data = display_data.copy()
             display_data['Select'] = False
             
-            # Filter data based on search
-            if search_query:
-                filtered_mask = display_data.astype(str).apply(
-                    lambda x: x.str.contains(search_query, case=False, na=False)).any(axis=1)
-                display_data = display_data[filtered_mask]
-            
             # Create a streamlit data editor for selection
             edited_df = st.data_editor(
                 display_data,
@@ -285,12 +761,17 @@ def main():
                 
                 if delete_button:
                     try:
-                        for _, customer in selected_rows.iterrows():
-                            result = CRMAgent.delete_customer(data, customer["Customer ID"], file_path)
+                        result, updated_data = CRMAgent.delete_customers(
+                            data, 
+                            selected_rows["Customer ID"].tolist(), 
+                            file_path
+                        )
+                        if updated_data is None:
+                            st.error(result)
+                        else:
                             st.success(result)
-                            # Reload data after each deletion
-                            data = CRMAgent.load_data(file_path)
-                        st.rerun()
+                            st.session_state["data_snapshot"] = store.publish(updated_data)
+                            st.rerun()
                     except Exception as e:
                         st.error(f"Error deleting customers: {e}")
         else:
@@ -307,6 +788,10 @@ def main():
                 st.dataframe(results)
             else:
                 st.info("No customers found matching the search term.")
+    
+    # The debug panel re-renders on every rerun, so it is opt-in
+    if os.getenv("MARTINA_DEBUG", "off").lower() in ("1", "on", "true"):
+        render_debug_panel(assistant)
 
 if __name__ == "__main__":
     main()
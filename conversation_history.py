@@ -0,0 +1,94 @@
+from typing import Callable, Dict, List
+
+try:
+    import tiktoken
+except ImportError:  # optional, token counts are estimated without it
+    tiktoken = None
+
+_ENCODING = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens of a text with tiktoken if installed, otherwise
+    estimate them at roughly four characters per token
+    """
+    global _ENCODING
+    if tiktoken is not None:
+        if _ENCODING is None:
+            _ENCODING = tiktoken.get_encoding("cl100k_base")
+        return len(_ENCODING.encode(text))
+    return len(text) // 4 + 1
+
+
+def extractive_summary(previous_summary: str, turns: List[Dict[str, str]], max_chars: int = 2000) -> str:
+    """
+    Summarize turns without a model call by keeping the start of each message
+    """
+    lines = [previous_summary] if previous_summary else []
+    for turn in turns:
+        lines.append(f"User asked: {turn['user'][:150]}")
+        lines.append(f"Martina replied: {turn['martina'][:150]}")
+    summary = "\n".join(lines)
+    # Keep the most recent part if the summary grows too long
+    return summary[-max_chars:]
+
+
+class HistoryCompactor:
+    """
+    Turns the conversation history into prompt messages within a token
+    budget. The last keep_turns turns are sent verbatim; older turns are
+    folded into a rolling summary that is computed once per folded batch
+    and reused on every later message.
+    """
+
+    def __init__(self, keep_turns: int = 6, token_budget: int = 1500, fold_batch: int = 4):
+        self.keep_turns = keep_turns
+        self.token_budget = token_budget
+        self.fold_batch = fold_batch
+        self.summary = ""
+        self.summarized_turns = 0
+
+    def reset(self) -> None:
+        """
+        Forget the rolling summary, e.g. when the conversation is cleared
+        """
+        self.summary = ""
+        self.summarized_turns = 0
+
+    def _verbatim_tokens(self, turns: List[Dict[str, str]]) -> int:
+        return sum(count_tokens(turn["user"]) + count_tokens(turn["martina"]) for turn in turns)
+
+    def messages(self, conversation_history: List[Dict[str, str]],
+                 summarize: Callable[[str, List[Dict[str, str]]], str] = extractive_summary) -> List[Dict[str, str]]:
+        """
+        Return the chat messages representing the history. summarize(previous
+        summary, turns) is only called when new turns have to be folded.
+        """
+        if len(conversation_history) < self.summarized_turns:
+            self.reset()
+        
+        # Fold in batches so the summary is not recomputed on every message
+        fold_until = self.summarized_turns
+        if len(conversation_history) - fold_until > self.keep_turns + self.fold_batch:
+            fold_until = len(conversation_history) - self.keep_turns
+        
+        # Fold further if the remaining turns still exceed the token budget,
+        # down to three quarters of it so the next turns fit without a refold
+        summary_tokens = count_tokens(self.summary)
+        if summary_tokens + self._verbatim_tokens(conversation_history[fold_until:]) > self.token_budget:
+            while (fold_until < len(conversation_history)
+                   and summary_tokens + self._verbatim_tokens(conversation_history[fold_until:]) > self.token_budget * 3 // 4):
+                fold_until += 1
+        
+        if fold_until > self.summarized_turns:
+            self.summary = summarize(self.summary, conversation_history[self.summarized_turns:fold_until])
+            self.summarized_turns = fold_until
+        
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"})
+        for turn in conversation_history[self.summarized_turns:]:
+            messages.append({"role": "user", "content": turn["user"]})
+            messages.append({"role": "assistant", "content": turn["martina"]})
+        return messages
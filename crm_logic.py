@@ -1,96 +1,1100 @@
+import numpy as np
 import pandas as pd
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, Optional, Tuple, Union
 import streamlit as st
+import hashlib
 import os
+import re
+import threading
+import weakref
+from contextlib import contextmanager
+from crm_storage import ChangeLog, get_storage
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Define required columns and their types
+REQUIRED_COLUMNS = {
+    "Customer ID": "Int64",
+    "First Name": "object",
+    "Last Name": "object",
+    "Email": "object", 
+    "Phone": "object", 
+    "Status": "object", 
+    "Amount": "float64"
+}
+
+# Parsed DataFrames shared across Streamlit reruns and sessions, keyed by the
+# absolute file path. Each entry remembers the file signature it was parsed from.
+_DATA_CACHE: Dict[str, Tuple[Tuple[int, ...], pd.DataFrame]] = {}
+_CACHE_STATS = {"hits": 0, "misses": 0}
+_CACHE_LOCK = threading.Lock()
+
+# Aggregates per data version, shared by all sessions looking at the same data
+_ANALYTICS_CACHE: Dict[str, Dict[str, Any]] = {}
+_ANALYTICS_CACHE_SIZE = 8
+
+# Prompt context text for Martina per data version
+_CONTEXT_CACHE: Dict[str, str] = {}
+
+# Lookup structures derived from a DataFrame (e.g. the Customer ID index), keyed
+# by the frame's id() and dropped when the frame is garbage collected
+_FRAME_STATE: Dict[int, Dict[str, Any]] = {}
+
+# Change logs are folded into their data file by a background thread once
+# they reach this size or the oldest change reaches this age (seconds)
+_CHANGE_LOG_MAX_BYTES = 1 << 20
+_CHANGE_LOG_MAX_AGE = 300
+_COMPACT_INTERVAL = 30
+_COMPACTOR = {"thread": None, "files": set(), "wake": threading.Event()}
+
+# pandas >= 3 always uses copy-on-write; older versions may opt in
+_COPY_ON_WRITE = int(pd.__version__.split(".")[0]) >= 3 or pd.options.mode.copy_on_write is True
+
+
+def _file_signature(file_path: str) -> Optional[Tuple[int, ...]]:
+    """
+    Return (mtime_ns, size, inode) for a file, or None if it does not exist.
+    SQLite in WAL mode commits to the -wal file first, and the file formats
+    log row changes to the .wal change log, so those are included too.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    for suffix in ("-wal", ChangeLog.suffix):
+        try:
+            wal_stat = os.stat(file_path + suffix)
+        except OSError:
+            continue
+        signature += (wal_stat.st_mtime_ns, wal_stat.st_size)
+    return signature
+
+
+def _frame_state(data: pd.DataFrame, share_with: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+    """
+    Return the derived-state dict of a DataFrame, creating it on first use.
+    If share_with is given, the frame reuses that frame's state instead.
+    """
+    key = id(data)
+    state = _FRAME_STATE.get(key)
+    if state is None or share_with is not None:
+        if share_with is not None:
+            state = _frame_state(share_with)
+        else:
+            state = {}
+        if key not in _FRAME_STATE:
+            weakref.finalize(data, _FRAME_STATE.pop, key, None)
+        _FRAME_STATE[key] = state
+    return state
+
+
+def _get_derived(data: pd.DataFrame, name: str) -> Any:
+    """
+    Return a derived structure of the DataFrame if it was built for its current length
+    """
+    entry = _frame_state(data).get(name)
+    if entry is not None and entry[0] == len(data):
+        return entry[1]
+    return None
+
+
+def _set_derived(data: pd.DataFrame, name: str, value: Any) -> None:
+    """
+    Store a derived structure for the DataFrame. A stale entry means the state
+    was shared with a frame of different length, so this frame gets its own.
+    """
+    state = _frame_state(data)
+    entry = state.get(name)
+    if entry is not None and entry[0] != len(data):
+        state = {key: item for key, item in state.items() if item[0] == len(data)}
+        _FRAME_STATE[id(data)] = state
+    state[name] = (len(data), value)
+
+
+def _detach_state(data: pd.DataFrame) -> None:
+    """
+    Give a frame that is about to be modified in place its own copy of the
+    derived state, so frames sharing that state keep seeing their own data.
+    Plain values such as the data version are dropped and recomputed.
+    """
+    state = _frame_state(data)
+    _FRAME_STATE[id(data)] = {
+        name: (rows, value.copy()) for name, (rows, value) in state.items() if hasattr(value, "copy")
+    }
+
+
+def _row_text(rows: pd.DataFrame) -> pd.Series:
+    """
+    Join the lowercase string form of every column of each row. The separator
+    cannot be typed into a search box, so matches never span two columns.
+    """
+    columns = [rows[column].astype(str).str.lower().fillna("") for column in rows.columns]
+    text = columns[0]
+    for column in columns[1:]:
+        text = text + SearchIndex.SEPARATOR + column
+    return text.reset_index(drop=True)
+
+
+def _same_value(a: Any, b: Any) -> bool:
+    """
+    Compare two cell values, treating missing values as equal and ignoring
+    type differences from parsing (e.g. a phone number read as int or str)
+    """
+    a_missing = a is None or (not isinstance(a, str) and pd.isna(a))
+    b_missing = b is None or (not isinstance(b, str) and pd.isna(b))
+    if a_missing or b_missing:
+        return a_missing and b_missing
+    return a == b or str(a) == str(b)
+
+
+def _id_list(ids: pd.Series) -> list:
+    """
+    Convert a Customer ID column to a list of Python ints (fast path without NA)
+    """
+    if ids.hasnans:
+        return ids.tolist()
+    return ids.to_numpy(dtype="int64").tolist()
+
+
+def _shared_copy(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Copy a cached DataFrame so callers can mutate it without touching the cache.
+    With copy-on-write enabled a shallow copy is enough and costs O(1).
+    The copy shares the derived state (e.g. Customer ID index) of the original.
+    """
+    copy = df.copy(deep=False) if _COPY_ON_WRITE else df.copy()
+    _frame_state(copy, share_with=df)
+    return copy
+
+
+@contextmanager
+def _file_lock(file_path: str, shared: bool = False):
+    """
+    Hold a lock on the sidecar .lock file of a data file: shared for readers,
+    exclusive for writers. The lock works across processes and threads.
+    Windows has no shared locks, so readers take the exclusive lock there.
+    """
+    with open(file_path + ".lock", "a+") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class SearchIndex:
+    """
+    Inverted index from the distinct lowercase string values of each column
+    to the rows holding them. A substring query scans the distinct values
+    once (all values of a column joined into one string) instead of every
+    row, so repeated values such as Status or names are only checked once.
+    Rows modified after the index was built are tracked and checked directly.
+    """
+    SEPARATOR = "\x00"
+
+    def __init__(self, data: pd.DataFrame):
+        self.row_count = len(data)
+        self.changed = set()
+        self.columns = {}
+        for column in data.columns:
+            codes, values = pd.factorize(data[column].astype(str).str.lower())
+            values = np.asarray(values, dtype=object).tolist()
+            lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+            offsets = np.concatenate(([0], np.cumsum(lengths + 1)))
+            self.columns[column] = {
+                "text": self.SEPARATOR.join(values),
+                "offsets": offsets,
+                "codes": codes,
+            }
+
+    def needs_rebuild(self) -> bool:
+        """
+        Return True once too many rows changed for lookups to stay fast
+        """
+        return len(self.changed) > max(1000, self.row_count // 100)
+
+    def mark_changed(self, positions: Iterable[int]) -> None:
+        """
+        Mark rows as modified or appended since the index was built
+        """
+        self.changed.update(int(position) for position in positions)
+
+    def without_rows(self, positions: np.ndarray) -> "SearchIndex":
+        """
+        Return a copy of the index with the given row positions removed
+        """
+        index = SearchIndex.__new__(SearchIndex)
+        index.row_count = self.row_count - len(positions)
+        index.columns = {
+            column: {
+                "text": entry["text"],
+                "offsets": entry["offsets"],
+                "codes": np.delete(entry["codes"], positions[positions < len(entry["codes"])]),
+            }
+            for column, entry in self.columns.items()
+        }
+        removed = set(positions.tolist())
+        index.changed = {
+            position - int(np.searchsorted(positions, position))
+            for position in self.changed
+            if position not in removed
+        }
+        return index
+
+    def copy(self) -> "SearchIndex":
+        """
+        Return a copy that can track changed rows independently
+        """
+        index = SearchIndex.__new__(SearchIndex)
+        index.row_count = self.row_count
+        index.columns = self.columns
+        index.changed = set(self.changed)
+        return index
+
+    def lookup(self, search_text: pd.Series, query: str) -> np.ndarray:
+        """
+        Return the sorted row positions where any column contains query.
+        search_text is the current per-row search text, used for changed rows.
+        """
+        query = query.lower()
+        pattern = re.compile(re.escape(query))
+        matches = []
+        for entry in self.columns.values():
+            hits = [match.start() for match in pattern.finditer(entry["text"])]
+            if hits:
+                value_ids = np.unique(np.searchsorted(entry["offsets"], hits, side="right") - 1)
+                matches.append(self._rows_for(entry, value_ids))
+        positions = np.unique(np.concatenate(matches)) if matches else np.empty(0, dtype=np.intp)
+        
+        # Rows changed since the build are verified against their current values
+        if self.changed:
+            changed = np.array(sorted(self.changed), dtype=np.intp)
+            positions = positions[~np.isin(positions, changed)]
+            hit = search_text.iloc[changed].str.contains(query, regex=False).to_numpy(dtype=bool)
+            positions = np.union1d(positions, changed[hit])
+        return positions
+
+    @staticmethod
+    def _rows_for(entry: Dict[str, Any], value_ids: np.ndarray) -> np.ndarray:
+        """
+        Return the row positions holding any of the given distinct values
+        """
+        codes = entry["codes"]
+        if len(value_ids) <= 32:
+            # Few values: use the sorted postings lists
+            if "order" not in entry:
+                entry["order"] = np.argsort(codes, kind="stable")
+                entry["bounds"] = np.searchsorted(codes[entry["order"]], np.arange(len(entry["offsets"])))
+            order, bounds = entry["order"], entry["bounds"]
+            return np.concatenate([order[bounds[value_id]:bounds[value_id + 1]] for value_id in value_ids])
+        
+        # Many values: one vectorized pass over the codes (code -1 is a missing value)
+        matched = np.zeros(len(entry["offsets"]), dtype=bool)
+        matched[value_ids] = True
+        return np.flatnonzero(matched[codes])
+
+
+class ConcurrentModificationError(Exception):
+    """
+    Raised when a change conflicts with one saved by another session or process
+    """
+
 
 class CRMAgent:
     @staticmethod
     def load_data(file_path: str = "data.csv") -> pd.DataFrame:
         """
-        Load CRM data from CSV file with robust error handling and column management
-        """
-        # Define required columns at the start
-        required_columns = {
-            "Customer ID": "Int64",
-            "First Name": "object",
-            "Last Name": "object",
-            "Email": "object", 
-            "Phone": "object", 
-            "Status": "object", 
-            "Amount": "float64"
-        }
+        Load CRM data from file with robust error handling and column management.
+        The storage format (CSV, Parquet, Feather) is picked from the file extension.
+        Parsed data is cached per file and only re-read when the file changes.
+        """
+        return _shared_copy(CRMAgent._load_shared(file_path))
+
+    @staticmethod
+    def _load_shared(file_path: str = "data.csv") -> pd.DataFrame:
+        """
+        Return the cached DataFrame of a file itself rather than a copy,
+        reading the file if it changed. Callers must not modify it.
+        """
+        if not file_path:
+            file_path = "data.csv"
+        
+        cache_key = os.path.abspath(file_path)
+        signature = _file_signature(file_path)
         
+        with _CACHE_LOCK:
+            cached = _DATA_CACHE.get(cache_key)
+            if cached is not None and signature is not None and cached[0] == signature:
+                _CACHE_STATS["hits"] += 1
+                return cached[1]
+            _CACHE_STATS["misses"] += 1
+        
+        data = CRMAgent._read_data(file_path)
+        if data is None:
+            return CRMAgent._empty_frame()
+        
+        # Remember which version of the file the data came from, so saves can
+        # detect changes made by others in the meantime
+        data.attrs["source_signature"] = signature
+        
+        # Only cache successful reads of a file that did not change while parsing
+        if signature is not None and _file_signature(file_path) == signature:
+            with _CACHE_LOCK:
+                _DATA_CACHE[cache_key] = (signature, data)
+        
+        return data
+
+    @staticmethod
+    def cache_info() -> Dict[str, int]:
+        """
+        Return hit/miss counters and the number of cached files
+        """
+        with _CACHE_LOCK:
+            return {**_CACHE_STATS, "entries": len(_DATA_CACHE)}
+
+    @staticmethod
+    def clear_cache() -> None:
+        """
+        Drop all cached DataFrames and reset the counters
+        """
+        with _CACHE_LOCK:
+            _DATA_CACHE.clear()
+            _CACHE_STATS["hits"] = 0
+            _CACHE_STATS["misses"] = 0
+
+    @staticmethod
+    def _invalidate_cache(file_path: str) -> None:
+        """
+        Forget the cached DataFrame for a file after it has been rewritten
+        """
+        with _CACHE_LOCK:
+            _DATA_CACHE.pop(os.path.abspath(file_path), None)
+
+    @staticmethod
+    def _empty_frame() -> pd.DataFrame:
+        """
+        Return an empty DataFrame with the CRM columns
+        """
+        return pd.DataFrame(columns=list(REQUIRED_COLUMNS.keys()))
+
+    @staticmethod
+    def _read_data(file_path: str) -> Optional[pd.DataFrame]:
+        """
+        Parse the data file into a typed DataFrame, returning None on failure
+        """
         try:
-            # Check if file path is provided
-            if not file_path:
-                file_path = "data.csv"
-                
-            # Read CSV file if it exists
-            if os.path.exists(file_path):
-                data = pd.read_csv(file_path, delimiter=';')
+            # Read data file if it exists
+            if not os.path.exists(file_path):
+                return CRMAgent._apply_schema(CRMAgent._empty_frame())
+            
+            # Writers (e.g. compaction) never run between reading the file and its change log
+            with _file_lock(file_path, shared=True):
+                return CRMAgent._read_unlocked(file_path)
+            
+        except Exception as e:
+            st.error(f"Error loading data: {e}")
+            return None
+
+    @staticmethod
+    def _read_unlocked(file_path: str) -> pd.DataFrame:
+        """
+        Read the data file and apply its change log; the caller holds the file lock
+        """
+        data = CRMAgent._read_base(file_path)
+        
+        # Apply the changes logged since the file was last written
+        changes = ChangeLog(file_path).read()
+        if changes:
+            data = CRMAgent._replay_changes(data, changes)
+        return data
+
+    @staticmethod
+    def _read_base(file_path: str) -> pd.DataFrame:
+        """
+        Read the data file without its change log. A missing or empty file
+        holds no rows yet, e.g. when only logged inserts exist.
+        """
+        if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+            return CRMAgent._apply_schema(CRMAgent._empty_frame())
+        return CRMAgent._apply_schema(get_storage(file_path).read(file_path))
+
+    @staticmethod
+    def _apply_schema(data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Normalize freshly parsed rows to the CRM columns and types
+        """
+        required_columns = REQUIRED_COLUMNS
+        
+        # Drop unnecessary columns
+        data = data.drop(columns=[col for col in data.columns if 'Unnamed:' in col], errors='ignore')
+        
+        # Handle legacy data with Name field
+        if 'Name' in data.columns:
+            if 'First Name' not in data.columns or 'Last Name' not in data.columns:
+                # Split existing names into First Name and Last Name
+                name_parts = data['Name'].str.split(' ', n=1)
+                data['First Name'] = name_parts.str[0]
+                data['Last Name'] = name_parts.str[1].fillna('')  # Handle single names
+            # Remove the Name column
+            data = data.drop(columns=['Name'])
+        
+        # Ensure all expected columns are present with correct types
+        for column, dtype in required_columns.items():
+            if column not in data.columns:
+                data[column] = pd.Series(dtype=dtype)
+            else:
+                try:
+                    data[column] = data[column].astype(dtype)
+                except Exception:
+                    data[column] = pd.Series(dtype=dtype)
+        
+        # Remove completely empty rows and reset index
+        return data.dropna(how="all").reset_index(drop=True)
+
+    @staticmethod
+    def _replay_changes(data: pd.DataFrame, changes: list) -> pd.DataFrame:
+        """
+        Apply logged changes over the rows read from the data file. Inserting
+        an existing ID overwrites it and changes to missing IDs are ignored,
+        so replaying changes that are already in the file is harmless.
+        """
+        positions = dict(zip(_id_list(data['Customer ID']), range(len(data))))
+        
+        # Final record of every touched Customer ID, None once deleted
+        rows: Dict[Any, Optional[Dict[str, Any]]] = {}
+        for change in changes:
+            customer_id = change.get("id")
+            if change.get("op") == "delete":
+                rows[customer_id] = None
+                continue
+            if customer_id in rows:
+                record = rows[customer_id]
+            elif customer_id in positions:
+                record = data.iloc[positions[customer_id]].to_dict()
+            else:
+                record = None
+            if record is None and change.get("op") != "insert":
+                continue
+            record = {**(record or {}), **change.get("values", {})}
+            new_id = record.setdefault("Customer ID", customer_id)
+            if new_id != customer_id:
+                rows[customer_id] = None
+            rows[new_id] = record
+        
+        if not rows:
+            return data
+        
+        # Overwrite changed rows in place, then drop deleted ones and append new ones
+        changed_ids = [customer_id for customer_id, record in rows.items()
+                       if record is not None and customer_id in positions]
+        if changed_ids:
+            changed = CRMAgent._apply_schema(
+                pd.DataFrame([rows[customer_id] for customer_id in changed_ids]).reindex(columns=data.columns))
+            changed_positions = [positions[customer_id] for customer_id in changed_ids]
+            for column in data.columns:
+                data.iloc[changed_positions, data.columns.get_loc(column)] = changed[column].to_numpy()
+        
+        deleted_positions = [positions[customer_id] for customer_id, record in rows.items()
+                             if record is None and customer_id in positions]
+        if deleted_positions:
+            data = data.drop(index=data.index[deleted_positions])
+        
+        inserted = [record for customer_id, record in rows.items()
+                    if record is not None and customer_id not in positions]
+        if inserted:
+            new_rows = CRMAgent._apply_schema(pd.DataFrame(inserted).reindex(columns=data.columns))
+            data = pd.concat([data, new_rows], ignore_index=True)
+        
+        return data.reset_index(drop=True)
+
+    @staticmethod
+    def _log_changes(file_path: str, changes: list) -> None:
+        """
+        Append row changes to the change log of a data file and let the
+        background compactor know about it; the caller holds the file lock
+        """
+        log = ChangeLog(file_path)
+        log.append(changes)
+        CRMAgent._start_compactor(file_path)
+        if log.size() >= _CHANGE_LOG_MAX_BYTES:
+            _COMPACTOR["wake"].set()
+
+    @staticmethod
+    def compact_log(file_path: str = "data.csv", force: bool = True) -> str:
+        """
+        Fold the change log into a fresh copy of the data file and remove it.
+        Without force this only happens once the log is large or old enough.
+        """
+        log = ChangeLog(file_path)
+        try:
+            with _file_lock(file_path):
+                changes = log.read()
+                if not changes:
+                    log.truncate()
+                    return "No logged changes to compact"
+                if not force and log.size() < _CHANGE_LOG_MAX_BYTES and log.age() < _CHANGE_LOG_MAX_AGE:
+                    return f"{len(changes)} logged changes are below the compaction thresholds"
                 
-                # Drop unnecessary columns
-                data = data.drop(columns=[col for col in data.columns if 'Unnamed:' in col], errors='ignore')
+                storage = get_storage(file_path)
+                data = CRMAgent._replay_changes(CRMAgent._read_base(file_path), changes)
                 
-                # Handle legacy data with Name field
-                if 'Name' in data.columns:
-                    if 'First Name' not in data.columns or 'Last Name' not in data.columns:
-                        # Split existing names into First Name and Last Name
-                        name_parts = data['Name'].str.split(' ', n=1)
-                        data['First Name'] = name_parts.str[0]
-                        data['Last Name'] = name_parts.str[1].fillna('')  # Handle single names
-                    # Remove the Name column
-                    data = data.drop(columns=['Name'])
-            else:
-                data = pd.DataFrame(columns=list(required_columns.keys()))
+                old_signature = _file_signature(file_path)
+                storage.write(data, file_path)
+                log.truncate()
+                new_signature = _file_signature(file_path)
             
-            # Ensure all expected columns are present with correct types
-            for column, dtype in required_columns.items():
-                if column not in data.columns:
-                    data[column] = pd.Series(dtype=dtype)
+            # The content is unchanged, so a cached copy of it stays valid
+            cache_key = os.path.abspath(file_path)
+            with _CACHE_LOCK:
+                cached = _DATA_CACHE.get(cache_key)
+                if cached is not None and cached[0] == old_signature and new_signature is not None:
+                    cached[1].attrs["source_signature"] = new_signature
+                    _DATA_CACHE[cache_key] = (new_signature, cached[1])
                 else:
-                    try:
-                        data[column] = data[column].astype(dtype)
-                    except Exception:
-                        data[column] = pd.Series(dtype=dtype)
+                    _DATA_CACHE.pop(cache_key, None)
             
-            # Remove completely empty rows and reset index
-            data = data.dropna(how="all").reset_index(drop=True)
-            
-            return data
+            return f"Compacted {len(changes)} logged changes into {file_path}"
             
         except Exception as e:
-            st.error(f"Error loading data: {e}")
-            return pd.DataFrame(columns=list(required_columns.keys()))
+            return f"Error compacting change log: {str(e)}"
+
+    @staticmethod
+    def _start_compactor(file_path: str) -> None:
+        """
+        Register a data file with the background compactor thread, starting
+        the thread on first use
+        """
+        with _CACHE_LOCK:
+            _COMPACTOR["files"].add(os.path.abspath(file_path))
+            thread = _COMPACTOR["thread"]
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=CRMAgent._run_compactor, name="crm-compactor", daemon=True)
+                _COMPACTOR["thread"] = thread
+                thread.start()
+
+    @staticmethod
+    def _run_compactor() -> None:
+        """
+        Periodically compact the change logs of registered files that passed
+        the size or age threshold
+        """
+        while True:
+            _COMPACTOR["wake"].wait(_COMPACT_INTERVAL)
+            _COMPACTOR["wake"].clear()
+            with _CACHE_LOCK:
+                files = list(_COMPACTOR["files"])
+            for file_path in files:
+                CRMAgent.compact_log(file_path, force=False)
+                if not os.path.exists(file_path + ChangeLog.suffix):
+                    with _CACHE_LOCK:
+                        _COMPACTOR["files"].discard(file_path)
 
     @staticmethod
     def save_data(df: pd.DataFrame, file_path: str = "data.csv") -> None:
         """
-        Save DataFrame to CSV file
+        Save DataFrame to the data file in the format given by its extension.
+        The frame already contains any logged changes, so the log is dropped.
+        Raises ConcurrentModificationError if the frame was loaded from a
+        version of the file that has been changed since.
+        """
+        try:
+            with _file_lock(file_path):
+                base_signature = df.attrs.get("source_signature")
+                if base_signature is not None and _file_signature(file_path) != base_signature:
+                    raise ConcurrentModificationError(
+                        f"{file_path} was changed by another session; reload the data and try again")
+                get_storage(file_path).write(df, file_path)
+                ChangeLog(file_path).truncate()
+                df.attrs["source_signature"] = _file_signature(file_path)
+            CRMAgent._invalidate_cache(file_path)
+            st.success(f"Data successfully saved to {file_path}")
+        except ConcurrentModificationError:
+            raise
+        except Exception as e:
+            st.error(f"Error saving data to {file_path}: {e}")
+            raise
+
+    @staticmethod
+    def append_data(data: pd.DataFrame, records: pd.DataFrame, file_path: str = "data.csv") -> Optional[pd.DataFrame]:
+        """
+        Append records to the end of the data file without rewriting it and
+        return the DataFrame with them added. Returns None if the file cannot
+        be appended to (missing, empty or a different column layout).
         """
+        if not os.path.exists(file_path) or sorted(records.columns) != sorted(data.columns):
+            return None
+        
         try:
-            df.to_csv(file_path, index=False, sep=';')
+            with _file_lock(file_path):
+                signature = _file_signature(file_path)
+                storage = get_storage(file_path)
+                appended = storage.append(records, file_path)
+                if appended is None:
+                    if storage.can_append:
+                        # The file cannot be appended to as it is, e.g. it is empty
+                        return None
+                    # Formats without append support log the new rows instead
+                    CRMAgent._log_changes(file_path, [
+                        {"op": "insert", "id": record["Customer ID"], "values": record}
+                        for record in records.to_dict('records')
+                    ])
+                    appended = records
+                new_signature = _file_signature(file_path)
+            
+            # Normalize the appended rows the same way load_data would
+            new_rows = CRMAgent._apply_schema(appended)
+            
+            # One concat for all new rows; the indexes are extended, not rebuilt
+            updated_data = pd.concat([data, new_rows[data.columns]], ignore_index=True)
+            updated_data.attrs = dict(data.attrs)
+            CRMAgent._rows_appended(data, updated_data, new_rows['Customer ID'].tolist())
+            
+            # New rows never conflict, but a frame that lacks other sessions'
+            # changes must not become the cached version
+            if signature != data.attrs.get("source_signature", signature):
+                CRMAgent._invalidate_cache(file_path)
+            else:
+                CRMAgent._refresh_cache(updated_data, file_path, signature, new_signature, len(data))
+            
             st.success(f"Data successfully saved to {file_path}")
+            return updated_data
+            
+        except Exception as e:
+            st.error(f"Error appending data to {file_path}: {e}")
+            raise
+
+    @staticmethod
+    def _save_rows(data: pd.DataFrame, file_path: str, previous_rows: int,
+                   updated: Optional[Dict[Any, Dict[str, Any]]] = None,
+                   deleted: Optional[list] = None,
+                   expected: Optional[Dict[Any, Dict[str, Any]]] = None) -> None:
+        """
+        Persist an update or delete, touching only the affected rows when the
+        storage backend supports it and appending to the change log otherwise.
+        expected holds the values the updated fields had when the data was
+        loaded; if another session saved in the meantime, the update is merged
+        unless that session changed one of the same fields.
+        """
+        if not os.path.exists(file_path):
+            CRMAgent.save_data(data, file_path)
+            return
+        
+        storage = get_storage(file_path)
+        try:
+            with _file_lock(file_path):
+                signature = _file_signature(file_path)
+                base_signature = data.attrs.get("source_signature", signature)
+                changed_elsewhere = signature != base_signature
+                if changed_elsewhere and expected:
+                    CRMAgent._check_conflicts(file_path, expected)
+                
+                if updated is not None:
+                    written = storage.update_rows(updated, file_path)
+                else:
+                    written = storage.delete_rows(deleted, file_path)
+                if not written:
+                    if updated is not None:
+                        changes = [{"op": "update", "id": customer_id, "values": values}
+                                   for customer_id, values in updated.items()]
+                    else:
+                        changes = [{"op": "delete", "id": customer_id} for customer_id in deleted]
+                    CRMAgent._log_changes(file_path, changes)
+                new_signature = _file_signature(file_path)
+        except ConcurrentModificationError:
+            raise
         except Exception as e:
             st.error(f"Error saving data to {file_path}: {e}")
             raise
+        
+        if changed_elsewhere:
+            # The frame lacks the other session's changes, so it must not be cached
+            CRMAgent._invalidate_cache(file_path)
+        else:
+            CRMAgent._refresh_cache(data, file_path, signature, new_signature, previous_rows)
+        st.success(f"Data successfully saved to {file_path}")
+
+    @staticmethod
+    def _check_conflicts(file_path: str, expected: Dict[Any, Dict[str, Any]]) -> None:
+        """
+        Raise ConcurrentModificationError if a field about to be written no
+        longer has the value it was loaded with; the caller holds the file lock
+        """
+        # Backends with row access only read the customers being written
+        rows = get_storage(file_path).read_rows(list(expected), file_path)
+        current = CRMAgent._apply_schema(rows) if rows is not None else CRMAgent._read_unlocked(file_path)
+        positions = CRMAgent.customer_index(current)
+        for customer_id, fields in expected.items():
+            position = positions.get(customer_id)
+            if position is None:
+                raise ConcurrentModificationError(
+                    f"Customer with ID {customer_id} was deleted by another session")
+            row = current.iloc[position]
+            changed = [column for column, value in fields.items()
+                       if column in row.index and not _same_value(row[column], value)]
+            if changed:
+                raise ConcurrentModificationError(
+                    f"{', '.join(changed)} of customer {customer_id} was changed by another session; "
+                    "reload the data and try again")
+
+    @staticmethod
+    def _refresh_cache(data: pd.DataFrame, file_path: str, old_signature: Optional[Tuple[int, ...]],
+                       new_signature: Optional[Tuple[int, ...]], old_rows: int) -> None:
+        """
+        After writing a change, make the changed frame the cached version if the
+        cache held the version the change was based on; otherwise drop it
+        """
+        cache_key = os.path.abspath(file_path)
+        data.attrs["source_signature"] = new_signature
+        with _CACHE_LOCK:
+            cached = _DATA_CACHE.get(cache_key)
+            if (cached is not None and new_signature is not None
+                    and cached[0] == old_signature and len(cached[1]) == old_rows):
+                _DATA_CACHE[cache_key] = (new_signature, _shared_copy(data))
+            else:
+                _DATA_CACHE.pop(cache_key, None)
 
     @staticmethod
-    def add_customer(data: pd.DataFrame, customer_details: Dict[str, Any], file_path: str = "data.csv") -> str:
+    def migrate_storage(source_path: str, target_path: str) -> str:
         """
-        Add a new customer to the CRM
+        Copy CRM data to another storage format, e.g. data.csv -> data.parquet.
+        The format of each file is picked from its extension.
+        """
+        try:
+            if not os.path.exists(source_path):
+                return f"Error: {source_path} does not exist"
+            if get_storage(source_path) is get_storage(target_path):
+                return f"Error: {source_path} and {target_path} use the same storage format"
+            
+            data = CRMAgent.load_data(source_path)
+            # The version token belongs to the source file
+            data.attrs.pop("source_signature", None)
+            CRMAgent.save_data(data, target_path)
+            
+            # Keep handing out IDs where the source left off
+            if os.path.exists(source_path + ".seq") and not os.path.exists(target_path + ".seq"):
+                with open(source_path + ".seq") as f:
+                    last_id = f.read().strip()
+                with open(target_path + ".seq", "w") as f:
+                    f.write(last_id)
+            
+            return f"Migrated {len(data)} customers from {source_path} to {target_path}"
+            
+        except Exception as e:
+            return f"Error migrating data: {str(e)}"
+
+    @staticmethod
+    def next_customer_id(data: pd.DataFrame, file_path: str = "data.csv") -> int:
+        """
+        Allocate the next Customer ID from the sidecar .seq file under a file lock.
+        The sequence is rebuilt from the highest existing ID only when it is missing.
+        """
+        seq_path = file_path + ".seq"
+        
+        with _file_lock(file_path):
+            try:
+                with open(seq_path) as f:
+                    last_id = int(f.read().strip())
+            except (OSError, ValueError):
+                last_id = CRMAgent._max_customer_id(data, file_path)
+            
+            new_id = last_id + 1
+            
+            # Write the new value atomically so a crash never leaves a torn file
+            tmp_path = seq_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(str(new_id))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, seq_path)
+        
+        return new_id
+
+    @staticmethod
+    def _max_customer_id(data: pd.DataFrame, file_path: str) -> int:
+        """
+        Return the highest Customer ID on disk or in memory, or 0 if there is none
+        """
+        max_id = 0
+        if os.path.exists(file_path):
+            try:
+                ids = get_storage(file_path).read(file_path, columns=['Customer ID'])['Customer ID']
+                if ids.notna().any():
+                    max_id = int(ids.max())
+            except Exception:
+                # Missing column or unreadable file: fall back to the in-memory data
+                pass
+        if not data.empty and 'Customer ID' in data.columns and data['Customer ID'].notna().any():
+            max_id = max(max_id, int(data['Customer ID'].max()))
+        return max_id
+
+    @staticmethod
+    def customer_index(data: pd.DataFrame) -> Dict[Any, int]:
+        """
+        Return a Customer ID -> row position mapping for the DataFrame.
+        The mapping is built once per frame and kept up to date on add/delete.
+        """
+        index = _get_derived(data, "customer_index")
+        if index is None:
+            index = dict(zip(_id_list(data['Customer ID']), range(len(data))))
+            _set_derived(data, "customer_index", index)
+        return index
+
+    @staticmethod
+    def search_index(data: pd.DataFrame) -> "SearchIndex":
+        """
+        Return the inverted search index for the DataFrame, building it on first use
+        """
+        index = _get_derived(data, "search_index")
+        if index is None or index.needs_rebuild():
+            index = SearchIndex(data)
+            _set_derived(data, "search_index", index)
+        return index
+
+    @staticmethod
+    def data_version(data: pd.DataFrame) -> str:
+        """
+        Return a content hash identifying this version of the data, computed once per frame
+        """
+        version = _get_derived(data, "data_version")
+        if version is None:
+            digest = hashlib.sha1(";".join(map(str, data.columns)).encode("utf-8"))
+            digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+            version = digest.hexdigest()
+            _set_derived(data, "data_version", version)
+        return version
+
+    @staticmethod
+    def analytics(data: pd.DataFrame) -> Dict[str, Any]:
+        """
+        Return aggregate statistics (status counts, Amount statistics, top
+        customers, duplicates), computed once per data version
+        """
+        version = CRMAgent.data_version(data)
+        with _CACHE_LOCK:
+            cached = _ANALYTICS_CACHE.get(version)
+        if cached is not None:
+            return cached
+        
+        amount = data['Amount'].astype("float64")
+        status = data['Status'].fillna("Unknown").astype(str)
+        full_name = (data['First Name'].fillna("").astype(str) + " " + data['Last Name'].fillna("").astype(str)).str.strip()
+        
+        # Amount distribution, overall and per status
+        quantiles = amount.quantile([0.25, 0.5, 0.75, 0.9]) if amount.notna().any() else pd.Series(dtype="float64")
+        status_counts = status.value_counts()
+        by_status = amount.groupby(status).agg(["count", "sum", "mean"]).reindex(status_counts.index)
+        
+        # Customers sharing an email address or a full name, with the
+        # largest groups as examples
+        email_key = data['Email'].fillna("").astype(str).str.strip().str.lower()
+        duplicates = {}
+        for label, key in (("Email", email_key), ("Name", full_name.str.lower())):
+            counts = key[key != ""].value_counts()
+            counts = counts[counts > 1]
+            examples = counts.index[:20]
+            example_rows = data.loc[key.isin(examples), 'Customer ID']
+            example_ids = example_rows.groupby(key[example_rows.index].to_numpy()).agg(_id_list)
+            duplicates[label] = {
+                "groups": len(counts),
+                "customers": int(counts.sum()),
+                "examples": {value: example_ids[value] for value in examples},
+            }
+        
+        top = data.assign(**{"Name": full_name})[amount.notna().to_numpy()].nlargest(10, 'Amount')
+        
+        result = {
+            "total_customers": len(data),
+            "status_counts": status_counts.to_dict(),
+            "amount": {
+                "total": float(amount.sum()),
+                "mean": float(amount.mean()) if amount.notna().any() else 0.0,
+                "min": float(amount.min()) if amount.notna().any() else 0.0,
+                "max": float(amount.max()) if amount.notna().any() else 0.0,
+                "percentiles": {int(q * 100): float(value) for q, value in quantiles.items()},
+            },
+            # count is the number of customers, amount_count those with an Amount
+            "amount_by_status": {
+                value: {
+                    "count": int(status_counts[value]),
+                    "amount_count": int(row["count"]),
+                    "total": float(row["sum"]) if row["count"] else 0.0,
+                    "mean": float(row["mean"]) if row["count"] else 0.0,
+                }
+                for value, row in by_status.iterrows()
+            },
+            "top_customers": top[['Customer ID', 'Name', 'Status', 'Amount']].to_dict('records'),
+            "duplicates": duplicates,
+        }
+        
+        with _CACHE_LOCK:
+            _ANALYTICS_CACHE[version] = result
+            while len(_ANALYTICS_CACHE) > _ANALYTICS_CACHE_SIZE:
+                _ANALYTICS_CACHE.pop(next(iter(_ANALYTICS_CACHE)))
+        return result
+
+    @staticmethod
+    def context_summary(data: pd.DataFrame) -> str:
+        """
+        Return a compact description of the data (schema, row count, Status
+        distribution, Amount statistics) for the chat prompt, built once per
+        data version from the cached aggregates
+        """
+        version = CRMAgent.data_version(data)
+        with _CACHE_LOCK:
+            cached = _CONTEXT_CACHE.get(version)
+        if cached is not None:
+            return cached
+        
+        stats = CRMAgent.analytics(data)
+        amount = stats["amount"]
+        schema = ", ".join(f"{column} ({dtype})" for column, dtype in data.dtypes.astype(str).items())
+        status_lines = [
+            f"  - {value}: {info['count']} customers, total {info['total']:,.2f}, mean {info['mean']:,.2f}"
+            if info["amount_count"] else f"  - {value}: {info['count']} customers, no Amounts"
+            for value, info in stats["amount_by_status"].items()
+        ]
+        percentiles = ", ".join(f"p{percent} {value:,.2f}" for percent, value in amount["percentiles"].items())
+        top = "; ".join(f"{row['Name']} (ID {row['Customer ID']}, {row['Amount']:,.2f})" for row in stats["top_customers"][:5])
+        
+        lines = [
+            "Current CRM Data Overview:",
+            f"- Total Customers: {stats['total_customers']}",
+            f"- Columns: {schema}",
+            "- Customers by Status:",
+            *status_lines,
+            f"- Amount: total {amount['total']:,.2f}, mean {amount['mean']:,.2f}, "
+            f"min {amount['min']:,.2f}, max {amount['max']:,.2f}" + (f", {percentiles}" if percentiles else ""),
+        ]
+        if top:
+            lines.append(f"- Highest Amounts: {top}")
+        context = "\n".join(lines)
+        
+        with _CACHE_LOCK:
+            _CONTEXT_CACHE[version] = context
+            while len(_CONTEXT_CACHE) > _ANALYTICS_CACHE_SIZE:
+                _CONTEXT_CACHE.pop(next(iter(_CONTEXT_CACHE)))
+        return context
+
+    @staticmethod
+    def top_customers(data: pd.DataFrame, n: int = 10) -> pd.DataFrame:
+        """
+        Return the n customers with the highest Amount
+        """
+        if n <= 10:
+            return pd.DataFrame(CRMAgent.analytics(data)["top_customers"][:n])
+        top = data[data['Amount'].notna().to_numpy()].nlargest(n, 'Amount')
+        return top.assign(Name=(top['First Name'].fillna("") + " " + top['Last Name'].fillna("")).str.strip())[
+            ['Customer ID', 'Name', 'Status', 'Amount']]
+
+    @staticmethod
+    def search_text(data: pd.DataFrame) -> pd.Series:
+        """
+        Return the lowercase search text of every row, computed once per frame
+        """
+        text = _get_derived(data, "search_text")
+        if text is None:
+            text = _row_text(data)
+            _set_derived(data, "search_text", text)
+        return text
+
+    @staticmethod
+    def _rows_appended(data: pd.DataFrame, updated_data: pd.DataFrame, new_ids: list) -> None:
+        """
+        Derive the indexes of updated_data from those of data after rows were
+        appended at the end
+        """
+        old_rows = len(data)
+        if len(updated_data) != old_rows + len(new_ids):
+            return
+        
+        index = _get_derived(data, "customer_index")
+        if index is not None:
+            index = index.copy()
+            index.update(zip(new_ids, range(old_rows, len(updated_data))))
+            _set_derived(updated_data, "customer_index", index)
+        
+        search_index = _get_derived(data, "search_index")
+        if search_index is not None:
+            search_index = search_index.copy()
+            search_index.mark_changed(range(old_rows, len(updated_data)))
+            _set_derived(updated_data, "search_index", search_index)
+        
+        text = _get_derived(data, "search_text")
+        if text is not None:
+            text = pd.concat([text, _row_text(updated_data.iloc[old_rows:])], ignore_index=True)
+            _set_derived(updated_data, "search_text", text)
+
+    @staticmethod
+    def _rows_changed(data: pd.DataFrame, positions: Iterable[int]) -> None:
+        """
+        Record rows whose values were modified in place
+        """
+        positions = list(positions)
+        
+        index = _get_derived(data, "search_index")
+        if index is not None:
+            index.mark_changed(positions)
+        
+        text = _get_derived(data, "search_text")
+        if text is not None:
+            text.iloc[positions] = _row_text(data.iloc[positions]).to_numpy()
+
+    @staticmethod
+    def _rows_removed(data: pd.DataFrame, updated_data: pd.DataFrame, positions: np.ndarray) -> None:
+        """
+        Derive the indexes of updated_data from those of data after rows were removed
+        """
+        if len(positions) == 0 or len(updated_data) != len(data) - len(positions):
+            return
+        positions = np.sort(positions)
+        
+        index = _get_derived(data, "customer_index")
+        if index is not None:
+            index = index.copy()
+            for customer_id in _id_list(data['Customer ID'].iloc[positions]):
+                index.pop(customer_id, None)
+            # Only rows after the first removed one shift position
+            first = int(positions[0])
+            shifted_ids = _id_list(updated_data['Customer ID'].iloc[first:])
+            index.update(zip(shifted_ids, range(first, len(updated_data))))
+            _set_derived(updated_data, "customer_index", index)
+        
+        search_index = _get_derived(data, "search_index")
+        if search_index is not None:
+            _set_derived(updated_data, "search_index", search_index.without_rows(positions))
+        
+        text = _get_derived(data, "search_text")
+        if text is not None:
+            _set_derived(updated_data, "search_text", text.drop(text.index[positions]).reset_index(drop=True))
+
+    @staticmethod
+    def add_customer(data: pd.DataFrame, customer_details: Dict[str, Any], file_path: str = "data.csv") -> Tuple[str, Optional[pd.DataFrame]]:
+        """
+        Add a new customer to the CRM. Returns a message and the frame with
+        the customer added, or None as the frame if nothing was saved.
         """
         try:
             # Validate input data
             required_fields = ["First Name", "Last Name", "Email", "Phone", "Status", "Amount"]
             for field in required_fields:
                 if field not in customer_details or not customer_details[field]:
-                    return f"Error: {field} is required"
+                    return f"Error: {field} is required", None
             
-            # Auto-increment Customer ID
-            new_id = 1
-            if not data.empty and 'Customer ID' in data.columns:
-                new_id = int(data['Customer ID'].max() + 1)
+            # Allocate the next Customer ID from the persistent sequence
+            new_id = CRMAgent.next_customer_id(data, file_path)
             
             # Add Customer ID to the details
             customer_details["Customer ID"] = new_id
@@ -98,65 +1102,295 @@ class CRMAgent:
             # Create new customer record
             new_record = pd.DataFrame([customer_details])
             
-            # Combine existing data with new record
-            updated_data = pd.concat([data, new_record], ignore_index=True)
-            
-            # Save updated data
-            CRMAgent.save_data(updated_data, file_path)
+            # Append the new record to the end of the file, falling back to
+            # a full rewrite if the file layout does not allow appending
+            appended = CRMAgent.append_data(data, new_record, file_path)
+            if appended is not None:
+                data = appended
+            else:
+                for attempt in range(3):
+                    try:
+                        updated_data = pd.concat([data, new_record], ignore_index=True)
+                        updated_data.attrs = dict(data.attrs)
+                        CRMAgent.save_data(updated_data, file_path)
+                        data = updated_data
+                        break
+                    except ConcurrentModificationError:
+                        # Someone else saved first: add the record to their version
+                        if attempt == 2:
+                            raise
+                        data = CRMAgent.load_data(file_path)
             
-            return f"Customer added successfully with ID {new_id}"
+            return f"Customer added successfully with ID {new_id}", data
             
         except Exception as e:
-            return f"Error adding customer: {str(e)}"
+            return f"Error adding customer: {str(e)}", None
 
     @staticmethod
-    def update_customer(data: pd.DataFrame, customer_id: int, updates: Dict[str, Any], file_path: str = "data.csv") -> str:
+    def update_customer(data: pd.DataFrame, customer_id: int, updates: Dict[str, Any], file_path: str = "data.csv") -> Tuple[str, Optional[pd.DataFrame]]:
         """
-        Update an existing customer record
+        Update an existing customer record in place. Returns a message and
+        the updated frame, or None if nothing was saved.
         """
         try:
             # Find the customer
-            customer_mask = data['Customer ID'] == customer_id
+            position = CRMAgent.customer_index(data).get(customer_id)
             
-            if not any(customer_mask):
-                return f"No customer found with ID {customer_id}"
+            if position is None:
+                return f"No customer found with ID {customer_id}", None
             
-            # Update the record
+            # Update the record, remembering the values it was loaded with
+            updates = {key: value for key, value in updates.items() if key in data.columns}
+            expected = {customer_id: data.iloc[position][list(updates)].to_dict()}
+            _detach_state(data)
+            row_label = data.index[position]
             for key, value in updates.items():
-                if key in data.columns:
-                    data.loc[customer_mask, key] = value
+                data.loc[row_label, key] = value
+            
+            # Changing the ID itself invalidates the indexes of this frame
+            if 'Customer ID' in updates:
+                _FRAME_STATE[id(data)] = {}
+            else:
+                CRMAgent._rows_changed(data, [position])
             
             # Save updated data
-            CRMAgent.save_data(data, file_path)
-            return f"Customer with ID {customer_id} updated successfully"
+            CRMAgent._save_rows(data, file_path, len(data), updated={customer_id: updates}, expected=expected)
+            return f"Customer with ID {customer_id} updated successfully", data
+            
+        except Exception as e:
+            return f"Error updating customer: {str(e)}", None
+
+    @staticmethod
+    def update_customers(data: pd.DataFrame, changes: Union[pd.DataFrame, Iterable[Tuple[int, Dict[str, Any]]]], file_path: str = "data.csv") -> Tuple[str, Optional[pd.DataFrame]]:
+        """
+        Apply edits to many customers in one vectorized pass and a single save.
+        changes is either a list of (customer_id, updates) pairs or a DataFrame
+        with a Customer ID column; missing/NaN values leave the field unchanged.
+        Returns a message and the updated frame (None if nothing was saved).
+        """
+        try:
+            if isinstance(changes, pd.DataFrame):
+                changes_df = changes.copy()
+            else:
+                changes_df = pd.DataFrame([{**updates, 'Customer ID': customer_id} for customer_id, updates in changes])
+            
+            if changes_df.empty:
+                return "No updates to apply", None
+            
+            # Merge several edits of the same customer, later values win
+            changes_df = changes_df.groupby('Customer ID', sort=False).last()
+            
+            # Align the edits on the Customer ID index
+            positions = changes_df.index.map(CRMAgent.customer_index(data))
+            found = positions.notna()
+            missing_ids = changes_df.index[~found].tolist()
+            changes_df = changes_df[found]
+            positions = positions[found].astype("int64")
+            
+            if changes_df.empty:
+                return f"No customers found with IDs {', '.join(map(str, missing_ids))}", None
+            
+            # Values the edited fields were loaded with, to detect conflicting saves
+            expected = {
+                customer_id: {column: data.iat[position, data.columns.get_loc(column)]
+                              for column, value in row.items()
+                              if column in data.columns and column != 'Customer ID' and not pd.isna(value)}
+                for (customer_id, row), position in zip(changes_df.to_dict('index').items(), positions)
+            }
+            
+            # Update one column at a time across all affected rows
+            _detach_state(data)
+            for column in changes_df.columns:
+                if column not in data.columns or column == 'Customer ID':
+                    continue
+                values = changes_df[column]
+                has_value = values.notna().to_numpy()
+                if has_value.any():
+                    data.iloc[positions[has_value], data.columns.get_loc(column)] = values[has_value].to_numpy()
+            CRMAgent._rows_changed(data, positions.tolist())
+            
+            # Save updated data
+            updated = {
+                customer_id: {column: value for column, value in row.items()
+                              if column in data.columns and column != 'Customer ID' and not pd.isna(value)}
+                for customer_id, row in changes_df.to_dict('index').items()
+            }
+            CRMAgent._save_rows(data, file_path, len(data), updated=updated, expected=expected)
+            
+            updated_count = len(changes_df)
+            result = f"{updated_count} customer{'s' if updated_count != 1 else ''} updated successfully"
+            if missing_ids:
+                result += f" (no customer found with ID {', '.join(map(str, missing_ids))})"
+            return result, data
             
         except Exception as e:
-            return f"Error updating customer: {str(e)}"
+            return f"Error updating customers: {str(e)}", None
 
     @staticmethod
     def search_records(data: pd.DataFrame, query: str) -> pd.DataFrame:
         """
-        Search for customers based on a query
+        Search for customers whose values contain the query (case-insensitive)
         """
+        if not query:
+            return data
         query = query.lower()
-        return data[data.astype(str).apply(lambda x: x.str.lower()).apply(
-            lambda x: x.str.contains(query, na=False)).any(axis=1)]
+        search_text = CRMAgent.search_text(data)
+        
+        # Very short queries match most distinct values, so one scan of the
+        # search text is cheaper than going through the index
+        if len(query) <= 2:
+            return data[search_text.str.contains(query, regex=False).to_numpy(dtype=bool)]
+        
+        positions = CRMAgent.search_index(data).lookup(search_text, query)
+        return data.iloc[positions]
 
     @staticmethod
-    def delete_customer(data: pd.DataFrame, customer_id: int, file_path: str = "data.csv") -> str:
+    def delete_customer(data: pd.DataFrame, customer_id: int, file_path: str = "data.csv") -> Tuple[str, Optional[pd.DataFrame]]:
         """
-        Delete a customer by ID
+        Delete a customer by ID. Returns a message and the remaining rows,
+        or None if nothing was deleted.
         """
         try:
-            if customer_id not in data['Customer ID'].values:
-                return f"No customer found with ID {customer_id}"
+            position = CRMAgent.customer_index(data).get(customer_id)
+            if position is None:
+                return f"No customer found with ID {customer_id}", None
             
             # Remove the customer
-            updated_data = data[data['Customer ID'] != customer_id]
+            updated_data = data.drop(index=data.index[position]).reset_index(drop=True)
+            CRMAgent._rows_removed(data, updated_data, np.array([position]))
             
             # Save updated data
-            CRMAgent.save_data(updated_data, file_path)
-            return f"Customer with ID {customer_id} deleted successfully"
+            CRMAgent._save_rows(updated_data, file_path, len(data), deleted=[customer_id])
+            return f"Customer with ID {customer_id} deleted successfully", updated_data
             
         except Exception as e:
-            return f"Error deleting customer: {str(e)}"
\ No newline at end of file
+            return f"Error deleting customer: {str(e)}", None
+
+    @staticmethod
+    def delete_customers(data: pd.DataFrame, customer_ids: Iterable[int], file_path: str = "data.csv") -> Tuple[str, Optional[pd.DataFrame]]:
+        """
+        Delete several customers by ID with a single filter and a single save.
+        Returns a message and the remaining rows (None if nothing was deleted).
+        """
+        try:
+            customer_ids = list(dict.fromkeys(customer_ids))
+            if not customer_ids:
+                return "No customers selected", None
+            
+            # Remove all selected customers at once
+            delete_mask = data['Customer ID'].isin(customer_ids)
+            deleted_count = int(delete_mask.sum())
+            if deleted_count == 0:
+                return f"No customers found with IDs {', '.join(map(str, customer_ids))}", None
+            
+            updated_data = data[~delete_mask].reset_index(drop=True)
+            CRMAgent._rows_removed(data, updated_data, np.flatnonzero(delete_mask.to_numpy()))
+            
+            # Save updated data
+            deleted_ids = set(_id_list(data.loc[delete_mask, 'Customer ID']))
+            CRMAgent._save_rows(updated_data, file_path, len(data), deleted=list(deleted_ids))
+            
+            missing_ids = [customer_id for customer_id in customer_ids if customer_id not in deleted_ids]
+            result = f"{deleted_count} customer{'s' if deleted_count != 1 else ''} deleted successfully"
+            if missing_ids:
+                result += f" (no customer found with ID {', '.join(map(str, missing_ids))})"
+            return result, updated_data
+            
+        except Exception as e:
+            return f"Error deleting customers: {str(e)}", None
+
+
+class DataSnapshot:
+    """
+    Read-only handle on one published version of the customer data. The
+    DataFrame is shared by every session holding this version, so it must
+    not be modified; pass editable() to the CRMAgent mutation methods.
+    """
+    __slots__ = ("version", "signature", "data", "file_path")
+
+    def __init__(self, version: int, signature: Optional[Tuple[int, ...]], data: pd.DataFrame, file_path: str):
+        self.version = version
+        self.signature = signature
+        self.data = data
+        self.file_path = file_path
+
+    def editable(self) -> pd.DataFrame:
+        """
+        Return a private copy to change, O(1) with copy-on-write
+        """
+        return _shared_copy(self.data)
+
+
+class DataStore:
+    """
+    Process-wide store holding one canonical DataFrame per data file. Every
+    change to the file, by this or another process, publishes a new numbered
+    version; sessions keep the snapshot they have until they refresh, and a
+    version is freed once no session holds it any more.
+    """
+    _stores: Dict[str, "DataStore"] = {}
+    _stores_lock = threading.Lock()
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._latest: Optional[DataSnapshot] = None
+
+    @classmethod
+    def get(cls, file_path: str = "data.csv") -> "DataStore":
+        """
+        Return the store of a data file, creating it on first use
+        """
+        key = os.path.abspath(file_path)
+        with cls._stores_lock:
+            store = cls._stores.get(key)
+            if store is None:
+                store = cls._stores[key] = cls(file_path)
+            return store
+
+    def snapshot(self) -> DataSnapshot:
+        """
+        Return the latest version, publishing a new one if the file changed
+        """
+        signature = _file_signature(self.file_path)
+        latest = self._latest
+        if latest is not None and latest.signature == signature:
+            return latest
+        
+        data = CRMAgent._load_shared(self.file_path)
+        with self._lock:
+            latest = self._latest
+            if latest is None or latest.data is not data:
+                version = latest.version + 1 if latest is not None else 1
+                # Failed reads carry no version token; tag them with the file
+                # state so they are not re-read on every call
+                latest = self._latest = DataSnapshot(
+                    version, data.attrs.get("source_signature") or signature, data, self.file_path)
+            return latest
+
+    def publish(self, data: Optional[pd.DataFrame]) -> DataSnapshot:
+        """
+        Publish the frame returned by a CRMAgent mutation as the latest
+        version. The file is only read if another process changed it since
+        the write, or if nothing was written (data is None).
+        """
+        signature = data.attrs.get("source_signature") if data is not None else None
+        if signature is None or signature != _file_signature(self.file_path):
+            return self.snapshot()
+        
+        cache_key = os.path.abspath(self.file_path)
+        with self._lock:
+            latest = self._latest
+            if latest is not None and latest.signature == signature:
+                return latest
+            # Reuse the frame the write put into the load cache, or cache this one
+            with _CACHE_LOCK:
+                cached = _DATA_CACHE.get(cache_key)
+                if cached is not None and cached[0] == signature:
+                    data = cached[1]
+                else:
+                    data = _shared_copy(data)
+                    _DATA_CACHE[cache_key] = (signature, data)
+            version = latest.version + 1 if latest is not None else 1
+            latest = self._latest = DataSnapshot(version, signature, data, self.file_path)
+            return latest
@@ -0,0 +1,487 @@
+import atexit
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing, suppress
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+
+# "always" fsyncs every write before it returns. "batch" leaves the fsyncs of
+# appends and of directories after a rename to a background thread that runs
+# every FSYNC_BATCH_INTERVAL seconds, for high write rates: a power loss may
+# then drop the last moments of writes. Rewritten files are always flushed
+# before the rename, so neither readers nor a crash see a partial file.
+FSYNC_MODE = os.getenv("CRM_FSYNC_MODE", "always")
+FSYNC_BATCH_INTERVAL = 0.05
+_PENDING_SYNC = {"paths": set(), "lock": threading.Lock(), "wake": threading.Event(), "thread": None}
+
+
+def _fsync_path(path: str) -> None:
+    """
+    Flush a file or directory to disk by path
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # Directories cannot be opened on Windows; the rename is durable there
+        if os.path.isdir(path):
+            return
+        raise
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def sync_pending() -> None:
+    """
+    Flush all writes whose fsync was deferred in batch mode
+    """
+    with _PENDING_SYNC["lock"]:
+        paths = _PENDING_SYNC["paths"]
+        _PENDING_SYNC["paths"] = set()
+    paths = list(paths)
+    for done, path in enumerate(paths):
+        try:
+            _fsync_path(path)
+        except FileNotFoundError:
+            # Removed since it was queued, so there is nothing left to flush
+            continue
+        except OSError:
+            # Keep the unsynced paths so the next sync retries them
+            with _PENDING_SYNC["lock"]:
+                _PENDING_SYNC["paths"].update(paths[done:])
+            raise
+
+
+def _run_syncer() -> None:
+    while True:
+        _PENDING_SYNC["wake"].wait()
+        time.sleep(FSYNC_BATCH_INTERVAL)
+        _PENDING_SYNC["wake"].clear()
+        # A failed fsync stays queued and is raised by the next sync_pending
+        # of a caller that depends on it, such as ChangeLog.truncate
+        with suppress(OSError):
+            sync_pending()
+
+
+def _make_durable(*paths: str) -> None:
+    """
+    fsync the given files/directories now, or queue them in batch mode
+    """
+    if FSYNC_MODE != "batch":
+        for path in paths:
+            _fsync_path(path)
+        return
+    with _PENDING_SYNC["lock"]:
+        _PENDING_SYNC["paths"].update(paths)
+        if _PENDING_SYNC["thread"] is None:
+            _PENDING_SYNC["thread"] = threading.Thread(target=_run_syncer, name="crm-fsync", daemon=True)
+            _PENDING_SYNC["thread"].start()
+            atexit.register(sync_pending)
+    _PENDING_SYNC["wake"].set()
+
+
+def atomic_write(file_path: str, write) -> None:
+    """
+    Write a file through a temporary file in the same directory that is then
+    renamed over it, so a crash or a concurrent reader sees either the old or
+    the new file but never a partial one. write(temp_path) creates the content.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(file_path)}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(temp_path)
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, temp_path)
+        else:
+            os.chmod(temp_path, 0o644)
+        # Flush the content before the rename, or a crash could leave the
+        # renamed file empty
+        _fsync_path(temp_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        with suppress(OSError):
+            os.remove(temp_path)
+        raise
+    # Persist the rename itself
+    _make_durable(directory)
+
+
+class StorageBackend:
+    """
+    Base class for the file formats CRM data can be stored in. Backends only
+    read and write raw frames; column normalization is done by CRMAgent.
+    """
+    name = "base"
+    extensions: Tuple[str, ...] = ()
+    # Whether append() can add rows in place; other backends log new rows
+    can_append = False
+
+    def read(self, file_path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Read the stored rows, optionally only the given columns
+        """
+        raise NotImplementedError
+
+    def write(self, df: pd.DataFrame, file_path: str) -> None:
+        """
+        Replace the stored rows with the DataFrame
+        """
+        raise NotImplementedError
+
+    def append(self, records: pd.DataFrame, file_path: str) -> Optional[pd.DataFrame]:
+        """
+        Append records to the stored rows without rewriting them and return
+        the records as read() would return them, or None if not supported
+        """
+        return None
+
+    def read_rows(self, customer_ids: List[Any], file_path: str) -> Optional[pd.DataFrame]:
+        """
+        Read only the given Customer IDs.
+        Returns None if the backend can only read the whole file.
+        """
+        return None
+
+    def update_rows(self, changes: Dict[Any, Dict[str, Any]], file_path: str) -> bool:
+        """
+        Write changed fields of the given Customer IDs in place.
+        Returns False if the backend can only rewrite the whole file.
+        """
+        return False
+
+    def delete_rows(self, customer_ids: Iterable[Any], file_path: str) -> bool:
+        """
+        Delete the given Customer IDs in place.
+        Returns False if the backend can only rewrite the whole file.
+        """
+        return False
+
+
+class CSVStorage(StorageBackend):
+    """
+    Semicolon separated CSV file (the original data.csv format)
+    """
+    name = "csv"
+    extensions = (".csv",)
+    can_append = True
+
+    def read(self, file_path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        return pd.read_csv(file_path, delimiter=';', usecols=columns)
+
+    def write(self, df: pd.DataFrame, file_path: str) -> None:
+        atomic_write(file_path, lambda path: df.to_csv(path, index=False, sep=';'))
+
+    def append(self, records: pd.DataFrame, file_path: str) -> Optional[pd.DataFrame]:
+        try:
+            if os.path.getsize(file_path) == 0:
+                return None
+        except OSError:
+            return None
+        
+        # Only append if the file already has exactly the same columns
+        file_columns = list(pd.read_csv(file_path, delimiter=';', nrows=0).columns)
+        if sorted(file_columns) != sorted(records.columns):
+            return None
+        
+        csv_text = records.to_csv(index=False, sep=';', columns=file_columns, lineterminator='\n')
+        header, rows = csv_text.split('\n', 1)
+        
+        with open(file_path, 'rb+') as f:
+            # Make sure the new rows start on their own line
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                rows = '\n' + rows
+            f.seek(0, os.SEEK_END)
+            f.write(rows.encode('utf-8'))
+        _make_durable(file_path)
+        
+        # Parse the appended rows the same way a full read would
+        return pd.read_csv(io.StringIO(csv_text), delimiter=';')
+
+
+def _require_pyarrow():
+    """
+    Import pyarrow, which is only needed for the columnar backends
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "pyarrow is required for Parquet/Feather storage. Install it with: pip install pyarrow"
+        ) from e
+
+
+def _arrow_ready(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Store object columns as strings; Arrow cannot hold mixed-type columns
+    (e.g. phone numbers parsed as ints next to ones entered as text)
+    """
+    df = df.reset_index(drop=True)
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].astype("string")
+    return df
+
+
+class ParquetStorage(StorageBackend):
+    """
+    Parquet file, read through a memory map
+    """
+    name = "parquet"
+    extensions = (".parquet",)
+
+    def read(self, file_path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        _require_pyarrow()
+        return pd.read_parquet(file_path, engine="pyarrow", columns=columns, memory_map=True)
+
+    def write(self, df: pd.DataFrame, file_path: str) -> None:
+        _require_pyarrow()
+        df = _arrow_ready(df)
+        atomic_write(file_path, lambda path: df.to_parquet(path, engine="pyarrow", index=False))
+
+
+class FeatherStorage(StorageBackend):
+    """
+    Uncompressed Arrow IPC (Feather v2) file, memory-mapped on read
+    """
+    name = "feather"
+    extensions = (".feather", ".arrow")
+
+    def read(self, file_path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        _require_pyarrow()
+        from pyarrow import feather
+        table = feather.read_table(file_path, columns=columns, memory_map=True)
+        return table.to_pandas()
+
+    def write(self, df: pd.DataFrame, file_path: str) -> None:
+        _require_pyarrow()
+        # Uncompressed so the memory map can be used without decoding
+        df = _arrow_ready(df)
+        atomic_write(file_path, lambda path: df.to_feather(path, compression="uncompressed"))
+
+
+def _sql_value(value: Any) -> Any:
+    """
+    Convert pandas/numpy scalars to types the sqlite3 module can bind
+    """
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    SQLite database in WAL mode with one row per customer. Unlike the file
+    formats, inserts, updates and deletes touch only the affected rows, each
+    call in a single transaction, so concurrent sessions can write safely.
+    """
+    name = "sqlite"
+    extensions = (".db", ".sqlite", ".sqlite3")
+    can_append = True
+    table = "customers"
+    column_types = {
+        "Customer ID": "INTEGER PRIMARY KEY",
+        "First Name": "TEXT",
+        "Last Name": "TEXT",
+        "Email": "TEXT",
+        "Phone": "TEXT",
+        "Status": "TEXT",
+        "Amount": "REAL",
+    }
+    # Most parameters SQLite accepts in one statement on older versions
+    max_params = 900
+
+    def __init__(self):
+        # Databases whose schema was set up, by (absolute path, inode)
+        self._ready = set()
+        self._ready_lock = threading.Lock()
+
+    def _connect(self, file_path: str) -> sqlite3.Connection:
+        """
+        Open a connection, setting up WAL mode and the table once per database
+        """
+        conn = sqlite3.connect(file_path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            key = (os.path.abspath(file_path), os.stat(file_path).st_ino)
+        except OSError:
+            key = None
+        with self._ready_lock:
+            if key is None or key not in self._ready:
+                conn.execute("PRAGMA journal_mode=WAL")
+                columns = ", ".join(f'"{column}" {sql_type}' for column, sql_type in self.column_types.items())
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {self.table} ({columns})')
+                if key is not None:
+                    self._ready.add(key)
+        return conn
+
+    def _insert(self, conn: sqlite3.Connection, df: pd.DataFrame) -> None:
+        """
+        Insert all rows of the DataFrame
+        """
+        columns = [column for column in df.columns if column in self.column_types]
+        placeholders = ", ".join("?" for _ in columns)
+        names = ", ".join(f'"{column}"' for column in columns)
+        rows = ([_sql_value(value) for value in row] for row in df[columns].itertuples(index=False))
+        conn.executemany(f"INSERT INTO {self.table} ({names}) VALUES ({placeholders})", rows)
+
+    def read(self, file_path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        names = ", ".join(f'"{column}"' for column in columns) if columns else "*"
+        with closing(self._connect(file_path)) as conn:
+            return pd.read_sql_query(f'SELECT {names} FROM {self.table} ORDER BY "Customer ID"', conn)
+
+    def write(self, df: pd.DataFrame, file_path: str) -> None:
+        with closing(self._connect(file_path)) as conn, conn:
+            conn.execute(f"DELETE FROM {self.table}")
+            self._insert(conn, df)
+
+    def append(self, records: pd.DataFrame, file_path: str) -> Optional[pd.DataFrame]:
+        with closing(self._connect(file_path)) as conn:
+            with conn:
+                self._insert(conn, records)
+            placeholders = ", ".join("?" for _ in range(len(records)))
+            ids = [_sql_value(value) for value in records["Customer ID"]]
+            return pd.read_sql_query(
+                f'SELECT * FROM {self.table} WHERE "Customer ID" IN ({placeholders}) ORDER BY "Customer ID"',
+                conn, params=ids)
+
+    def read_rows(self, customer_ids: List[Any], file_path: str) -> Optional[pd.DataFrame]:
+        # Primary key lookups, in chunks below the parameter limit
+        ids = [_sql_value(customer_id) for customer_id in customer_ids]
+        with closing(self._connect(file_path)) as conn:
+            chunks = [
+                pd.read_sql_query(
+                    f'SELECT * FROM {self.table} WHERE "Customer ID" IN ({", ".join("?" for _ in chunk)})',
+                    conn, params=chunk)
+                for chunk in (ids[start:start + self.max_params] for start in range(0, len(ids), self.max_params))
+            ]
+        return pd.concat(chunks, ignore_index=True) if chunks else None
+
+    def update_rows(self, changes: Dict[Any, Dict[str, Any]], file_path: str) -> bool:
+        with closing(self._connect(file_path)) as conn, conn:
+            for customer_id, updates in changes.items():
+                updates = {key: value for key, value in updates.items() if key in self.column_types}
+                if not updates:
+                    continue
+                assignments = ", ".join(f'"{column}" = ?' for column in updates)
+                conn.execute(
+                    f'UPDATE {self.table} SET {assignments} WHERE "Customer ID" = ?',
+                    [_sql_value(value) for value in updates.values()] + [_sql_value(customer_id)])
+        return True
+
+    def delete_rows(self, customer_ids: Iterable[Any], file_path: str) -> bool:
+        with closing(self._connect(file_path)) as conn, conn:
+            conn.executemany(
+                f'DELETE FROM {self.table} WHERE "Customer ID" = ?',
+                ((_sql_value(customer_id),) for customer_id in customer_ids))
+        return True
+
+
+class ChangeLog:
+    """
+    Write-ahead log of row changes kept next to a data file (<file>.wal) for
+    backends that can only rewrite the whole file. Each change is one JSON
+    line: {"op": "insert" | "update" | "delete", "id": ..., "values": {...}}.
+    Replaying a change twice gives the same result, so the log can be folded
+    into the data file and truncated afterwards without losing changes if
+    the process stops in between.
+    """
+    suffix = ".wal"
+
+    def __init__(self, file_path: str):
+        self.path = file_path + self.suffix
+
+    def append(self, changes: List[Dict[str, Any]]) -> None:
+        """
+        Durably append changes to the log
+        """
+        now = time.time()
+        lines = "".join(
+            json.dumps({**change, "ts": now}, default=_json_value) + "\n" for change in changes
+        )
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        _make_durable(self.path)
+
+    def read(self) -> List[Dict[str, Any]]:
+        """
+        Return all logged changes in order. A torn last line left by a crash
+        while appending is ignored.
+        """
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return []
+        changes = []
+        for line in lines:
+            try:
+                changes.append(json.loads(line))
+            except ValueError:
+                continue
+        return changes
+
+    def size(self) -> int:
+        """
+        Return the log size in bytes (0 if there is no log)
+        """
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def age(self) -> float:
+        """
+        Return the seconds since the oldest logged change (0 if the log is empty)
+        """
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                first = json.loads(f.readline())
+        except (OSError, ValueError):
+            return 0.0
+        return time.time() - first.get("ts", time.time())
+
+    def truncate(self) -> None:
+        """
+        Drop all logged changes once they are part of the data file
+        """
+        # The data file holding the changes must be on disk before the log goes
+        sync_pending()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _json_value(value: Any) -> Any:
+    """
+    Convert pandas/numpy scalars that json cannot serialize
+    """
+    value = _sql_value(value)
+    return value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+
+
+BACKENDS: Tuple[StorageBackend, ...] = (CSVStorage(), ParquetStorage(), FeatherStorage(), SQLiteStorage())
+
+
+def get_storage(file_path: str) -> StorageBackend:
+    """
+    Pick the storage backend from the file extension, defaulting to CSV
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    for backend in BACKENDS:
+        if extension in backend.extensions:
+            return backend
+    return BACKENDS[0]
@@ -0,0 +1,96 @@
+import json
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from crm_logic import CRMAgent
+
+# Read-only CRMAgent operations Martina can call through OpenAI tool calling
+TOOLS: List[Dict[str, Any]] = [
+    {
+        "type": "function",
+        "function": {
+            "name": "search_customers",
+            "description": "Find customers whose name, email, phone, status or any other field contains a search term.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "term": {"type": "string", "description": "Text to search for, e.g. a name or email"},
+                    "limit": {"type": "integer", "description": "Maximum number of customers to return (default 10)"},
+                },
+                "required": ["term"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_customer",
+            "description": "Get the full record of one customer by Customer ID.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "customer_id": {"type": "integer", "description": "The Customer ID"},
+                },
+                "required": ["customer_id"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "aggregate_by_status",
+            "description": "Get the number of customers (count), how many of them have an Amount (amount_count) and the total and mean Amount per Status, optionally for one Status only.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "status": {"type": "string", "description": "Only return this Status, e.g. Active"},
+                },
+            },
+        },
+    },
+]
+
+MAX_ROWS = 50
+
+
+def _records(rows: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Convert rows to JSON-safe records
+    """
+    return json.loads(rows.to_json(orient="records"))
+
+
+def run_tool(name: str, arguments: str, data: pd.DataFrame) -> str:
+    """
+    Execute a tool call against the in-memory data and return its JSON result
+    """
+    try:
+        args = json.loads(arguments or "{}")
+        
+        if name == "search_customers":
+            limit = max(1, min(int(args.get("limit") or 10), MAX_ROWS))
+            matches = CRMAgent.search_records(data, str(args.get("term", "")))
+            result = {"matches": len(matches), "customers": _records(matches.head(limit))}
+        
+        elif name == "get_customer":
+            position = CRMAgent.customer_index(data).get(int(args["customer_id"]))
+            if position is None:
+                result = {"error": f"No customer found with ID {args['customer_id']}"}
+            else:
+                result = {"customer": _records(data.iloc[[position]])[0]}
+        
+        elif name == "aggregate_by_status":
+            by_status = CRMAgent.analytics(data)["amount_by_status"]
+            status = args.get("status")
+            if status:
+                by_status = {value: info for value, info in by_status.items() if value.lower() == str(status).lower()}
+            result = {"by_status": by_status}
+        
+        else:
+            result = {"error": f"Unknown tool {name}"}
+    
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    
+    return json.dumps(result, default=str)
@@ -0,0 +1,101 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+class ModelRouter:
+    """
+    Decides which model answers a message. Short, plain requests (greetings,
+    lookups, counts) go to the fast model; anything asking for analysis,
+    explanations or writing goes to the strong model.
+    """
+    COMPLEX_PATTERN = re.compile(
+        r"\b(why|analy[sz]e|analysis|compare|comparison|trends?|explain|recommend\w*|strateg\w*|insights?|"
+        r"forecast|predict\w*|summari[sz]e|plan|write|draft|email to|segment\w*|improve)\b"
+    )
+
+    def __init__(self, strong_model: str = "gpt-4", fast_model: str = "gpt-4o-mini",
+                 strong_max_tokens: int = 300, fast_max_tokens: int = 200,
+                 max_simple_chars: int = 160, max_simple_turns: int = 12, enabled: bool = True):
+        self.strong_model = strong_model
+        self.fast_model = fast_model
+        self.strong_max_tokens = strong_max_tokens
+        self.fast_max_tokens = fast_max_tokens
+        self.max_simple_chars = max_simple_chars
+        self.max_simple_turns = max_simple_turns
+        self.enabled = enabled
+
+    def is_simple(self, message: str, conversation_history: Optional[list] = None) -> bool:
+        """
+        Classify a message as simple enough for the fast model
+        """
+        text = message.strip().lower()
+        if len(text) > self.max_simple_chars or self.COMPLEX_PATTERN.search(text):
+            return False
+        # Long conversations tend to need more context than the fast model handles well
+        return len(conversation_history or []) <= self.max_simple_turns
+
+    def route(self, message: str, conversation_history: Optional[list] = None) -> Dict[str, Any]:
+        """
+        Return the model parameters for a message
+        """
+        if self.enabled and self.is_simple(message, conversation_history):
+            return {"model": self.fast_model, "max_tokens": self.fast_max_tokens}
+        return {"model": self.strong_model, "max_tokens": self.strong_max_tokens}
+
+
+class ModelMetrics:
+    """
+    Per-model latency and token usage of completed OpenAI calls, kept in
+    memory for the lifetime of the server process
+    """
+
+    def __init__(self, max_samples: int = 1000):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, model: str, latency: float, prompt_tokens: int = 0, completion_tokens: int = 0,
+               first_token_latency: Optional[float] = None) -> None:
+        """
+        Record one call; latencies are in seconds
+        """
+        with self._lock:
+            entry = self._models.setdefault(model, {
+                "calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "latencies": [], "first_token_latencies": [],
+            })
+            entry["calls"] += 1
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+            entry["latencies"].append(latency)
+            if first_token_latency is not None:
+                entry["first_token_latencies"].append(first_token_latency)
+            # Keep a sliding window of recent samples for the percentiles
+            for key in ("latencies", "first_token_latencies"):
+                del entry[key][:-self.max_samples]
+
+    @staticmethod
+    def _percentiles(samples: List[float]) -> Dict[str, float]:
+        if not samples:
+            return {}
+        p50, p95 = np.percentile(samples, [50, 95])
+        return {"mean": float(np.mean(samples)), "p50": float(p50), "p95": float(p95)}
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Return calls, token totals and latency percentiles per model
+        """
+        with self._lock:
+            return {
+                model: {
+                    "calls": entry["calls"],
+                    "prompt_tokens": entry["prompt_tokens"],
+                    "completion_tokens": entry["completion_tokens"],
+                    "latency": self._percentiles(entry["latencies"]),
+                    "first_token_latency": self._percentiles(entry["first_token_latencies"]),
+                }
+                for model, entry in self._models.items()
+            }
@@ -0,0 +1,60 @@
+import random
+import time
+from typing import Any, Callable, Optional
+
+import openai
+
+# Errors worth another attempt: rate limits, 5xx responses, timeouts and
+# dropped connections (APITimeoutError is an APIConnectionError)
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+def create_client(api_key: str, base_url: Optional[str] = None, connect_timeout: float = 5.0,
+                  read_timeout: float = 60.0, max_connections: int = 20,
+                  keepalive_expiry: float = 120.0) -> openai.OpenAI:
+    """
+    Create an OpenAI client that keeps its connections alive between
+    requests. Retries are left to call_with_retries, so the SDK's own
+    retries are disabled.
+    """
+    timeout = openai.Timeout(read_timeout, connect=connect_timeout)
+    # httpx.Limits, taken from the SDK defaults so the transport is not imported directly
+    limits = type(openai.DEFAULT_CONNECTION_LIMITS)(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=keepalive_expiry
+    )
+    return openai.OpenAI(
+        api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0,
+        http_client=openai.DefaultHttpxClient(timeout=timeout, limits=limits)
+    )
+
+
+def _retry_delay(error: Exception, attempt: int, base_delay: float, max_delay: float) -> float:
+    """
+    Seconds to wait before the next attempt: the server's Retry-After if
+    given, otherwise exponential backoff with full jitter
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), max_delay)
+        except ValueError:
+            pass
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def call_with_retries(func: Callable[..., Any], *args: Any, max_retries: int = 3, base_delay: float = 0.5,
+                      max_delay: float = 8.0, **kwargs: Any) -> Any:
+    """
+    Call func, retrying on rate limits, server errors and connection problems
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            time.sleep(_retry_delay(e, attempt, base_delay, max_delay))
+
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Any, Dict, List, Optional
+
+
+class ResponseCache:
+    """
+    Persistent cache of Martina's replies, stored in a small SQLite file.
+    Entries are keyed on everything sent to the model including the CRM data
+    version, so a reply is only reused for the data it was generated for.
+    Sessions may stay on older data versions, so replies for other versions
+    are left to expire through the TTL and the LRU limit.
+    """
+
+    def __init__(self, path: str = ".martina_cache.sqlite", max_entries: int = 500, ttl_seconds: float = 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT, created REAL, last_used REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    @staticmethod
+    def make_key(messages: List[Dict[str, Any]], data_version: str, **params: Any) -> str:
+        """
+        Hash the prompt (system prompt, CRM context, conversation), the data
+        version and the model parameters into a cache key
+        """
+        payload = json.dumps(
+            {"messages": messages, "data_version": data_version, "params": params},
+            sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return the cached reply for a key, or None if missing or expired
+        """
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+
+        with self._lock:
+            self._stats["hits" if row is not None else "misses"] += 1
+        return row[0] if row is not None else None
+
+    def put(self, key: str, response: str) -> None:
+        """
+        Store a reply, evicting expired and least recently used entries
+        """
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self) -> None:
+        """
+        Remove all cached replies and reset the counters
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM responses")
+        with self._lock:
+            self._stats = {"hits": 0, "misses": 0}
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return hit/miss counters, hit rate and the number of stored replies
+        """
+        with closing(self._connect()) as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        with self._lock:
+            hits, misses = self._stats["hits"], self._stats["misses"]
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
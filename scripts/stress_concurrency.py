@@ -0,0 +1,137 @@
+"""
+Multi-process stress test for concurrent writes to one data file.
+
+Several processes add customers and update a small set of shared customers
+from stale copies of the data. Afterwards the script checks that no added
+customer was lost, no Customer ID was handed out twice and every edited
+field holds the value of its last successful write.
+
+    python scripts/stress_concurrency.py --workers 6 --ops 60
+    python scripts/stress_concurrency.py /tmp/stress/data.db
+
+Without a path the test runs on data.csv in a new temporary directory. The
+extension of the path selects the storage backend. An existing data file is
+only replaced, together with its lock, ID sequence, change log and SQLite
+journal files, when --force is given.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from crm_logic import CRMAgent
+from crm_storage import ChangeLog
+
+SHARED_CUSTOMERS = 20
+# Files the data file leaves next to itself
+COMPANION_SUFFIXES = (".lock", ".seq", ChangeLog.suffix, "-wal", "-shm", "-journal")
+
+
+def worker(worker_id: int, file_path: str, ops: int, queue) -> None:
+    """
+    Run ops random adds and updates, reloading before each like a rerun
+    """
+    rnd = random.Random(worker_id)
+    added, updated, conflicts, errors = [], {}, 0, []
+    for i in range(ops):
+        data = CRMAgent.load_data(file_path)
+        # Think time, so other processes write in between and the data goes stale
+        time.sleep(rnd.random() * 0.005)
+        
+        if rnd.random() < 0.4:
+            result, updated_data = CRMAgent.add_customer(data, {
+                "First Name": f"W{worker_id}", "Last Name": str(i), "Email": f"w{worker_id}-{i}@example.com",
+                "Phone": "1", "Status": "Prospect", "Amount": 1.0
+            }, file_path)
+            if updated_data is not None:
+                added.append(int(result.rsplit(" ", 1)[1]))
+            else:
+                errors.append(result)
+        else:
+            customer_id = rnd.randint(1, SHARED_CUSTOMERS)
+            field = rnd.choice(["Amount", "Phone"])
+            value = float(worker_id * 1000 + i) if field == "Amount" else f"{worker_id}-{i}"
+            result, updated_data = CRMAgent.update_customer(data, customer_id, {field: value}, file_path)
+            if updated_data is not None:
+                updated.setdefault((customer_id, field), []).append((time.time(), value))
+            elif "another session" in result:
+                conflicts += 1
+            else:
+                errors.append(result)
+    queue.put((added, updated, conflicts, errors))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("file_path", nargs="?",
+                        help="Data file to create, e.g. /tmp/stress/data.db (default: a new temporary directory)")
+    parser.add_argument("--workers", type=int, default=6)
+    parser.add_argument("--ops", type=int, default=60)
+    parser.add_argument("--force", action="store_true", help="Replace the data file if it exists")
+    args = parser.parse_args()
+    
+    if args.file_path is None:
+        args.file_path = os.path.join(tempfile.mkdtemp(prefix="crm-stress-"), "data.csv")
+    elif os.path.exists(args.file_path):
+        if not args.force:
+            parser.error(f"{args.file_path} exists; pass --force to replace it")
+        if not os.path.isfile(args.file_path):
+            parser.error(f"{args.file_path} is not a file")
+        for path in [args.file_path] + [args.file_path + suffix for suffix in COMPANION_SUFFIXES]:
+            if os.path.exists(path):
+                os.remove(path)
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(args.file_path)), exist_ok=True)
+    CRMAgent.save_data(pd.DataFrame({
+        "Customer ID": range(1, SHARED_CUSTOMERS + 1), "First Name": "A", "Last Name": "B",
+        "Email": "a@example.com", "Phone": "0", "Status": "Active", "Amount": 0.0
+    }), args.file_path)
+    
+    queue = mp.Queue()
+    processes = [mp.Process(target=worker, args=(worker_id, args.file_path, args.ops, queue))
+                 for worker_id in range(args.workers)]
+    started = time.time()
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    
+    CRMAgent.clear_cache()
+    final = CRMAgent.load_data(args.file_path)
+    added = [customer_id for result in results for customer_id in result[0]]
+    conflicts = sum(result[2] for result in results)
+    errors = [error for result in results for error in result[3]]
+    
+    ids = set(final["Customer ID"].tolist())
+    lost = [customer_id for customer_id in added if customer_id not in ids]
+    duplicates = len(added) - len(set(added))
+    
+    # The last successful write of each field must be its final value
+    last = {}
+    for result in results:
+        for key, writes in result[1].items():
+            for timestamp, value in writes:
+                if key not in last or timestamp > last[key][0]:
+                    last[key] = (timestamp, value)
+    positions = dict(zip(final["Customer ID"], range(len(final))))
+    mismatches = sum(1 for (customer_id, field), (_, value) in last.items()
+                     if str(final.iloc[positions[customer_id]][field]) != str(value))
+    
+    print(f"{args.file_path}: {time.time() - started:.1f}s, {len(added)} adds, {len(lost)} lost, "
+          f"{duplicates} duplicate IDs, {sum(len(writes) for result in results for writes in result[1].values())} updates, "
+          f"{conflicts} conflicts, {mismatches} final value mismatches, {len(errors)} errors")
+    for error in errors[:5]:
+        print(f"  {error}")
+    return 1 if lost or duplicates or mismatches or errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Table of questions Martina answers from the local aggregates, and of
+questions that must go to the model (expected answer None)
+"""
+import pandas as pd
+import pytest
+
+from app import AIAssistant
+
+DATA = pd.DataFrame({
+    "Customer ID": pd.array([1, 2, 3, 4], dtype="Int64"),
+    "First Name": ["Jane", "Bob", "Max", "Ann"],
+    "Last Name": ["Doe", "Smith", "Mu", "Lee"],
+    "Email": ["jane@example.com", "bob@example.com", "max@example.com", "ann@example.com"],
+    "Phone": ["111", "222", "333", "444"],
+    "Status": ["Active", "Prospect", "Inactive", "Active"],
+    "Amount": [120.0, 80.0, None, 40.0],
+})
+
+AMOUNT_BY_STATUS = (
+    "Amount by status:\n"
+    "- Active: total 160.00, average 80.00 (2 of 2 customers have an amount)\n"
+    "- Prospect: total 80.00, average 80.00 (1 of 1 customers have an amount)\n"
+    "- Inactive: none of 1 customers have an amount"
+)
+CUSTOMERS_BY_STATUS = "Customers by status (4 in total):\n- Active: 2\n- Prospect: 1\n- Inactive: 1"
+
+CASES = [
+    ("How many customers are there?", "There are 4 customers in the CRM."),
+    ("How many customers in the CRM?", "There are 4 customers in the CRM."),
+    ("How many active customers?", "There are 2 Active customers."),
+    ("What is the total amount?", "The total amount across all customers is 240.00."),
+    ("average amount of active customers", "The average amount of Active customers is 80.00."),
+    ("What's the median amount?", "The median amount across all customers is 80.00."),
+    ("What is the average amount per status?", AMOUNT_BY_STATUS),
+    ("total amount by status", AMOUNT_BY_STATUS),
+    ("how many customers per status", CUSTOMERS_BY_STATUS),
+    ("customers by status", CUSTOMERS_BY_STATUS),
+    ("top 2 customers", "Top 2 customers by amount:\n1. Jane Doe (ID 1, Active): 120.00\n2. Bob Smith (ID 2, Prospect): 80.00"),
+    ("any duplicates?", "I found no customers sharing an email address or a full name."),
+    # Narrowed or unsupported questions go to the model
+    ("what is the total amount for Jane Doe?", None),
+    ("How many customers signed up last month?", None),
+    ("how many customers have an amount?", None),
+    ("how many customers have the highest amount", None),
+    ("average amount of active and inactive customers", None),
+    ("how many active and prospect customers?", None),
+    ("top 2 active customers", None),
+    ("median amount of active customers", None),
+    ("what is the highest amount?", None),
+]
+
+
+@pytest.fixture(scope="module")
+def assistant():
+    return AIAssistant("sk-test", client=object())
+
+
+@pytest.mark.parametrize("question, expected", CASES)
+def test_answer_locally(assistant, question, expected):
+    assert assistant._answer_locally(question, DATA) == expected
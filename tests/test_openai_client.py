@@ -0,0 +1,126 @@
+"""
+Tests for the retrying, keep-alive OpenAI client against a local HTTP server
+that answers with scripted status codes. Run from the repository root:
+python -m pytest
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+import openai_client
+from openai_client import call_with_retries, create_client
+
+COMPLETION = {
+    "id": "chatcmpl-test",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-test",
+    "choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": "Hello"},
+        "finish_reason": "stop",
+    }],
+    "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+}
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """
+    Answers each request with the next (status, headers) of the server's
+    script, the last entry repeating, and records the client address
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        with server.lock:
+            server.clients.append(self.client_address)
+            status, headers = server.script[min(len(server.clients), len(server.script)) - 1]
+        if status == 200:
+            body = json.dumps(COMPLETION).encode()
+        else:
+            body = json.dumps({"error": {"message": f"status {status}", "type": "server_error"}}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ScriptedHandler)
+    httpd.lock = threading.Lock()
+    httpd.clients = []
+    httpd.script = [(200, {})]
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    # Record the backoff instead of sleeping
+    waited = []
+    monkeypatch.setattr(openai_client, "time", SimpleNamespace(sleep=waited.append))
+    return waited
+
+
+def _create(server, max_retries=3):
+    client = create_client("sk-test", base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    return call_with_retries(client.chat.completions.create, max_retries=max_retries, base_delay=0.01,
+                             model="gpt-test", messages=[{"role": "user", "content": "Hi"}])
+
+
+def test_retries_rate_limit_after_the_server_retry_after(server, delays):
+    server.script = [(429, {"retry-after": "2"}), (200, {})]
+    
+    response = _create(server)
+    
+    assert response.choices[0].message.content == "Hello"
+    assert len(server.clients) == 2
+    assert delays == [2.0]
+
+
+def test_retries_server_errors_on_one_keep_alive_connection(server, delays):
+    server.script = [(503, {}), (503, {}), (200, {})]
+    
+    response = _create(server)
+    
+    assert response.choices[0].message.content == "Hello"
+    assert len(server.clients) == 3
+    assert len(delays) == 2
+    # Every attempt reused the first connection
+    assert len(set(server.clients)) == 1
+
+
+def test_gives_up_after_max_retries(server, delays):
+    server.script = [(503, {})]
+    
+    with pytest.raises(openai.InternalServerError):
+        _create(server, max_retries=2)
+    
+    assert len(server.clients) == 3
+    assert len(delays) == 2
+
+
+def test_does_not_retry_client_errors(server, delays):
+    server.script = [(400, {}), (200, {})]
+    
+    with pytest.raises(openai.BadRequestError):
+        _create(server)
+    
+    assert len(server.clients) == 1
+    assert delays == []
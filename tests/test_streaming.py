@@ -0,0 +1,126 @@
+"""
+Regression tests for Martina's streaming and tool calling against a stubbed
+chat.completions.create. Run from the repository root: python -m pytest
+"""
+import json
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from app import AIAssistant
+from turn_metrics import TurnTrace
+
+QUESTION = "Explain how Jane Doe's account has developed"
+
+
+def _chunk(content=None, tool_calls=None, usage=None):
+    """
+    One streamed chunk; the final usage chunk has no choices
+    """
+    if usage is not None:
+        return SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=usage[0], completion_tokens=usage[1]))
+    delta = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+
+
+def _tool_delta(index, id=None, name=None, arguments=None):
+    return SimpleNamespace(index=index, id=id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+class StubCompletions:
+    """
+    Replays one scripted response per call and records the requests
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def create(self, **params):
+        self.requests.append(params)
+        response = self.responses.pop(0)
+        return iter(response) if params.get("stream") else response
+
+
+@pytest.fixture
+def data():
+    return pd.DataFrame({
+        "Customer ID": pd.array([1, 2], dtype="Int64"),
+        "First Name": ["Jane", "Bob"],
+        "Last Name": ["Doe", "Smith"],
+        "Email": ["jane@example.com", "bob@example.com"],
+        "Phone": ["111", "222"],
+        "Status": ["Active", "Prospect"],
+        "Amount": [120.0, 80.0],
+    })
+
+
+def _assistant(responses):
+    completions = StubCompletions(responses)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return AIAssistant("sk-test", client=client), completions
+
+
+def test_stream_yields_content_and_records_usage(data):
+    assistant, completions = _assistant([[
+        _chunk("Jane "), _chunk("is a loyal"), _chunk(" customer."), _chunk(usage=(50, 7)),
+    ]])
+    trace = TurnTrace()
+    
+    chunks = list(assistant.stream_chat_with_martina(QUESTION, data, [], trace=trace))
+    
+    assert chunks == ["Jane ", "is a loyal", " customer."]
+    assert completions.requests[0]["stream_options"] == {"include_usage": True}
+    record = trace.to_dict()
+    assert record["source"] == "openai"
+    assert (record["prompt_tokens"], record["completion_tokens"]) == (50, 7)
+
+
+def test_stream_assembles_fragmented_tool_calls(data):
+    # Two tool calls whose ids, names and arguments arrive split and interleaved
+    assistant, completions = _assistant([
+        [
+            _chunk(tool_calls=[_tool_delta(0, id="call_a", name="get_cus")]),
+            _chunk(tool_calls=[_tool_delta(0, name="tomer", arguments='{"custo')]),
+            _chunk(tool_calls=[_tool_delta(1, id="call_b", name="search_customers", arguments='{"term": ')]),
+            _chunk(tool_calls=[_tool_delta(0, arguments='mer_id": 1}')]),
+            _chunk(tool_calls=[_tool_delta(1, arguments='"Doe"}')]),
+            _chunk(usage=(40, 12)),
+        ],
+        [_chunk("Jane Doe has "), _chunk("an Amount of 120."), _chunk(usage=(90, 8))],
+    ])
+    trace = TurnTrace()
+    
+    reply = "".join(assistant.stream_chat_with_martina(QUESTION, data, [], trace=trace))
+    
+    assert reply == "Jane Doe has an Amount of 120."
+    assert len(completions.requests) == 2
+    messages = completions.requests[1]["messages"]
+    assistant_message, first_result, second_result = messages[-3:]
+    assert assistant_message["role"] == "assistant"
+    assert assistant_message["content"] is None
+    assert assistant_message["tool_calls"] == [
+        {"id": "call_a", "type": "function", "function": {"name": "get_customer", "arguments": '{"customer_id": 1}'}},
+        {"id": "call_b", "type": "function", "function": {"name": "search_customers", "arguments": '{"term": "Doe"}'}},
+    ]
+    assert first_result["tool_call_id"] == "call_a"
+    assert json.loads(first_result["content"])["customer"]["Email"] == "jane@example.com"
+    assert second_result["tool_call_id"] == "call_b"
+    assert json.loads(second_result["content"])["matches"] == 1
+    
+    record = trace.to_dict()
+    assert (record["prompt_tokens"], record["completion_tokens"]) == (130, 20)
+    assert "tools" in record["spans"]
+
+
+def test_stream_forces_an_answer_after_the_last_tool_round(data):
+    tool_round = [_chunk(tool_calls=[_tool_delta(0, id="call", name="aggregate_by_status", arguments="{}")])]
+    # The model keeps asking for tools; the last round must disable them
+    assistant, completions = _assistant([tool_round] * 3 + [[_chunk("Done.")]])
+    assistant.max_tool_rounds = 3
+    
+    reply = "".join(assistant.stream_chat_with_martina(QUESTION, data, []))
+    
+    assert reply == "Done."
+    assert [request.get("tool_choice") for request in completions.requests] == [None, None, None, "none"]
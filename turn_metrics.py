@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# Spans recorded for every chat turn, in the order they happen
+SPANS = ("local", "context", "cache", "api", "tools", "render")
+
+
+class TurnTrace:
+    """
+    Timing spans and OpenAI usage of a single chat turn
+    """
+
+    def __init__(self):
+        self.timestamp = time.time()
+        self.spans: Dict[str, float] = {}
+        self.calls: List[Dict[str, Any]] = []
+        self.source = "openai"
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        Add the time spent in the block to the named span. Time recorded for
+        other spans inside the block (e.g. an API call while building the
+        context) counts for those spans only.
+        """
+        started = time.perf_counter()
+        nested = sum(seconds for span, seconds in self.spans.items() if span != name)
+        try:
+            yield
+        finally:
+            nested = sum(seconds for span, seconds in self.spans.items() if span != name) - nested
+            self.add_time(name, time.perf_counter() - started - nested)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def add_call(self, model: str, latency: float, prompt_tokens: int, completion_tokens: int,
+                 first_token_latency: Optional[float] = None) -> None:
+        """
+        Record one completion call made during the turn
+        """
+        self.calls.append({
+            "model": model,
+            "latency": latency,
+            "first_token_latency": first_token_latency,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        })
+
+    def to_dict(self, total: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Return the trace as a JSON-serializable record. Given the wall time
+        of the whole turn, the time not covered by other spans is attributed
+        to rendering.
+        """
+        spans = dict(self.spans)
+        if total is not None:
+            spans["render"] = max(0.0, total - sum(spans.values()))
+            spans["total"] = total
+        return {
+            "timestamp": self.timestamp,
+            "source": self.source,
+            "spans": spans,
+            "calls": self.calls,
+            "prompt_tokens": sum(call["prompt_tokens"] for call in self.calls),
+            "completion_tokens": sum(call["completion_tokens"] for call in self.calls),
+        }
+
+
+class TurnRecorder:
+    """
+    Collects finished turn traces. Each record is appended to a JSON lines
+    file if jsonl_path is set, and aggregated into Prometheus counters that
+    are written to prometheus_path (for the node_exporter textfile collector)
+    if set.
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None, prometheus_path: Optional[str] = None, max_recent: int = 50):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=max_recent)
+        self._turns: Dict[str, int] = {}
+        self._span_seconds: Dict[str, List[float]] = {}
+        self._tokens: Dict[tuple, int] = {}
+
+    def record(self, trace: TurnTrace, total: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Store a finished turn and export it
+        """
+        record = trace.to_dict(total)
+        with self._lock:
+            self._recent.append(record)
+            self._turns[record["source"]] = self._turns.get(record["source"], 0) + 1
+            for name, seconds in record["spans"].items():
+                entry = self._span_seconds.setdefault(name, [0.0, 0])
+                entry[0] += seconds
+                entry[1] += 1
+            for call in record["calls"]:
+                for kind in ("prompt", "completion"):
+                    key = (call["model"], kind)
+                    self._tokens[key] = self._tokens.get(key, 0) + call[f"{kind}_tokens"]
+            
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            if self.prometheus_path:
+                # Write and rename so the collector never reads a partial file
+                temp_path = f"{self.prometheus_path}.tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    f.write(self._prometheus())
+                os.replace(temp_path, self.prometheus_path)
+        return record
+
+    def recent(self) -> List[Dict[str, Any]]:
+        """
+        Return the most recent turn records, newest first
+        """
+        with self._lock:
+            return list(reversed(self._recent))
+
+    def _prometheus(self) -> str:
+        lines = [
+            "# HELP martina_turns_total Chat turns by how they were answered.",
+            "# TYPE martina_turns_total counter",
+        ]
+        lines += [f'martina_turns_total{{source="{source}"}} {count}' for source, count in sorted(self._turns.items())]
+        lines += [
+            "# HELP martina_turn_span_seconds Time spent per chat turn phase.",
+            "# TYPE martina_turn_span_seconds summary",
+        ]
+        for name, (seconds, count) in sorted(self._span_seconds.items()):
+            lines.append(f'martina_turn_span_seconds_sum{{span="{name}"}} {seconds:.6f}')
+            lines.append(f'martina_turn_span_seconds_count{{span="{name}"}} {count}')
+        lines += [
+            "# HELP martina_tokens_total OpenAI tokens used by model.",
+            "# TYPE martina_tokens_total counter",
+        ]
+        lines += [f'martina_tokens_total{{model="{model}",type="{kind}"}} {count}'
+                  for (model, kind), count in sorted(self._tokens.items())]
+        return "\n".join(lines) + "\n"
+
+    def prometheus(self) -> str:
+        """
+        Return the aggregated metrics in the Prometheus text format
+        """
+        with self._lock:
+            return self._prometheus()